@@ -0,0 +1,249 @@
+# analytics.py
+"""
+Snapshot dạng cột (column) của bảng events trong bộ nhớ, để tính thống kê bằng NumPy.
+
+Mỗi cột là 1 mảng NumPy:
+    ids        int64   id sự kiện
+    start      int64   start_time dạng epoch giây (giờ "đồng hồ" lưu trong DB, coi như UTC)
+    end        int64   end_time dạng epoch giây, NO_END nếu không có
+    location   int32   locations.id (chỉ số trong location_names), -1 nếu không có
+    reminder   int32   reminder_minutes
+    notified   int8
+    alive      bool    False nếu sự kiện đã bị xóa sau lần build gần nhất
+
+refresh() chỉ đọc `PRAGMA data_version` (O(1)); khi DB đổi thì áp các thay đổi
+lấy từ db.changes_since thay vì đọc lại toàn bộ bảng.
+"""
+import sqlite3
+import threading
+from array import array
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+import db
+
+NO_END = -1
+_EPOCH = datetime(1970, 1, 1)
+_FETCH_CHUNK = 50_000
+_ID_CHUNK = 500     # số id mỗi lần "WHERE id IN (...)" (dưới giới hạn tham số của SQLite)
+# tỉ lệ dòng "chết" (đã xóa/sửa) vượt mức này thì build lại từ đầu cho gọn
+_MAX_DEAD_RATIO = 0.25
+
+# strftime('%s') parse chuỗi ISO ngay trong SQLite (kể cả offset múi giờ -> UTC),
+# không cần fromisoformat từng dòng; dùng chung cho rebuild và cập nhật tăng dần
+_SELECT_COLUMNS = """
+    SELECT id,
+           CAST(strftime('%s', start_time) AS INTEGER),
+           CAST(strftime('%s', end_time) AS INTEGER),
+           COALESCE(location_id, -1), reminder_minutes, notified
+    FROM events
+"""
+
+WEEKDAY_NAMES = ["T2", "T3", "T4", "T5", "T6", "T7", "CN"]
+REMINDER_BINS = (0, 5, 10, 15, 30, 60, 120, 24 * 60)
+
+
+def _to_epoch(value: Optional[str]) -> int:
+    if not value:
+        return NO_END
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is not None:
+        # giống strftime('%s') của SQLite: có offset thì đổi về UTC
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return int((dt - _EPOCH).total_seconds())
+
+
+class EventSnapshot:
+    """Ảnh chụp dạng cột của bảng events, cập nhật tăng dần."""
+
+    def __init__(self):
+        # kết nối riêng, giữ mở: data_version chỉ có nghĩa trên cùng 1 kết nối
+        self._conn = sqlite3.connect(db.DB_NAME, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self._data_version = None
+        self._token = None
+        self.location_names: List[str] = []
+        self.rebuild()
+
+    # ==========================
+    # BUILD / REFRESH
+    # ==========================
+
+    def _load_locations(self) -> None:
+        """Đọc bảng locations (nhỏ): location_names[id] = tên hiển thị."""
+        rows = self._conn.execute("SELECT id, name FROM locations").fetchall()
+        size = max((row[0] for row in rows), default=-1) + 1
+        self.location_names = [""] * size
+        for location_id, name in rows:
+            self.location_names[location_id] = name
+
+    def _read_data_version(self) -> int:
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def rebuild(self) -> None:
+        """Đọc lại toàn bộ bảng events thành các cột."""
+        with self._lock:
+            self._rebuild_locked()
+
+    def _rebuild_locked(self) -> None:
+        ids, start, end = array("q"), array("q"), array("q")
+        location, reminder, notified = array("i"), array("i"), array("b")
+
+        self._data_version = self._read_data_version()
+        cur = self._conn.cursor()
+        # token và dữ liệu đọc trong cùng 1 transaction -> nhất quán với nhau
+        cur.execute("BEGIN")
+        try:
+            cur.execute("SELECT COALESCE(MAX(seq), 0) FROM event_changes")
+            self._token = str(cur.fetchone()[0])
+            self._load_locations()
+            cur.execute(_SELECT_COLUMNS)
+            while True:
+                rows = cur.fetchmany(_FETCH_CHUNK)
+                if not rows:
+                    break
+                for row in rows:
+                    if row[1] is None:
+                        continue    # start_time không hợp lệ
+                    ids.append(row[0])
+                    start.append(row[1])
+                    end.append(NO_END if row[2] is None else row[2])
+                    location.append(row[3])
+                    reminder.append(row[4] or 0)
+                    notified.append(row[5] or 0)
+        finally:
+            cur.execute("COMMIT")
+
+        self.ids = np.frombuffer(ids, dtype=np.int64).copy()
+        self.start = np.frombuffer(start, dtype=np.int64).copy()
+        self.end = np.frombuffer(end, dtype=np.int64).copy()
+        self.location = np.frombuffer(location, dtype=np.int32).copy()
+        self.reminder = np.frombuffer(reminder, dtype=np.int32).copy()
+        self.notified = np.frombuffer(notified, dtype=np.int8).copy()
+        self.alive = np.ones(len(self.ids), dtype=bool)
+        self._index = {int(event_id): i for i, event_id in enumerate(self.ids)}
+
+    def refresh(self) -> None:
+        """Cập nhật snapshot nếu DB đã thay đổi kể từ lần đọc trước."""
+        with self._lock:
+            version = self._read_data_version()
+            if version == self._data_version:
+                return
+            try:
+                self._apply_changes()
+            except db.SyncTokenExpiredError:
+                self._rebuild_locked()
+                return
+            # chỉ ghi nhận version khi đã áp xong; lỗi giữa chừng -> lần sau thử lại
+            self._data_version = version
+            if len(self.alive) and 1 - self.alive.mean() > _MAX_DEAD_RATIO:
+                self._rebuild_locked()
+
+    def _apply_changes(self) -> None:
+        # 1. đọc danh sách id thay đổi (chưa sửa gì trên snapshot)
+        token = self._token
+        changed = set()
+        while True:
+            page = db.changes_since(token, limit=_FETCH_CHUNK)
+            changed.update(change["id"] for change in page["changes"])
+            token = page["token"]
+            if not page["has_more"]:
+                break
+        if not changed:
+            self._token = token
+            return
+
+        # 2. đọc lại các dòng đó bằng cùng câu SELECT với rebuild
+        #    (epoch tính bằng strftime('%s') trong SQLite, sự kiện đã xóa sẽ không có dòng)
+        new_rows = []
+        ids = list(changed)
+        for i in range(0, len(ids), _ID_CHUNK):
+            chunk = ids[i:i + _ID_CHUNK]
+            placeholders = ", ".join("?" * len(chunk))
+            rows = self._conn.execute(
+                f"{_SELECT_COLUMNS} WHERE id IN ({placeholders})", chunk).fetchall()
+            new_rows.extend(
+                (row[0], row[1], NO_END if row[2] is None else row[2], row[3],
+                 row[4] or 0, row[5] or 0)
+                for row in rows if row[1] is not None
+            )
+        if new_rows and max(row[3] for row in new_rows) >= len(self.location_names):
+            self._load_locations()      # có địa điểm mới
+
+        # 3. áp lên snapshot: dòng cũ đánh dấu chết, bản mới thêm vào cuối
+        for event_id in changed:
+            idx = self._index.pop(event_id, None)
+            if idx is not None:
+                self.alive[idx] = False
+        self._token = token
+        if not new_rows:
+            return
+        base = len(self.ids)
+        cols = list(zip(*new_rows))
+        self.ids = np.concatenate([self.ids, np.array(cols[0], dtype=np.int64)])
+        self.start = np.concatenate([self.start, np.array(cols[1], dtype=np.int64)])
+        self.end = np.concatenate([self.end, np.array(cols[2], dtype=np.int64)])
+        self.location = np.concatenate([self.location, np.array(cols[3], dtype=np.int32)])
+        self.reminder = np.concatenate([self.reminder, np.array(cols[4], dtype=np.int32)])
+        self.notified = np.concatenate([self.notified, np.array(cols[5], dtype=np.int8)])
+        self.alive = np.concatenate([self.alive, np.ones(len(new_rows), dtype=bool)])
+        for i, row in enumerate(new_rows):
+            self._index[row[0]] = base + i
+
+    # ==========================
+    # THỐNG KÊ (VECTOR HÓA)
+    # ==========================
+
+    def _mask(self, start_dt: Optional[datetime] = None, end_dt: Optional[datetime] = None) -> np.ndarray:
+        mask = self.alive.copy()
+        if start_dt is not None:
+            mask &= self.start >= _to_epoch(start_dt.isoformat())
+        if end_dt is not None:
+            mask &= self.start < _to_epoch(end_dt.isoformat())
+        return mask
+
+    def count(self, start_dt: Optional[datetime] = None, end_dt: Optional[datetime] = None) -> int:
+        with self._lock:
+            return int(self._mask(start_dt, end_dt).sum())
+
+    def weekday_hour_heatmap(self, start_dt: Optional[datetime] = None,
+                             end_dt: Optional[datetime] = None) -> np.ndarray:
+        """Mảng 7x24: số sự kiện theo (thứ, giờ bắt đầu); hàng 0 = thứ Hai."""
+        with self._lock:
+            start = self.start[self._mask(start_dt, end_dt)]
+        days, seconds = np.divmod(start, 86400)
+        weekday = (days + 3) % 7     # 01/01/1970 là thứ Năm
+        cells = weekday * 24 + seconds // 3600
+        return np.bincount(cells, minlength=7 * 24).reshape(7, 24)
+
+    def reminder_lead_time_histogram(self, bins: Tuple[int, ...] = REMINDER_BINS,
+                                     start_dt: Optional[datetime] = None,
+                                     end_dt: Optional[datetime] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Phân bố reminder_minutes. Trả về (bins, counts) với counts[i] là số sự kiện
+        có bins[i] <= reminder < bins[i+1]; phần tử cuối gom mọi giá trị >= bins[-1].
+        """
+        with self._lock:
+            reminder = self.reminder[self._mask(start_dt, end_dt)]
+        edges = np.asarray(bins)
+        which = np.searchsorted(edges, reminder, side="right") - 1
+        counts = np.bincount(which[which >= 0], minlength=len(edges))
+        return edges, counts
+
+    def busiest_locations(self, n: int = 10, start_dt: Optional[datetime] = None,
+                          end_dt: Optional[datetime] = None) -> List[Tuple[str, int]]:
+        """n địa điểm có nhiều sự kiện nhất: [(tên, số sự kiện), ...]."""
+        with self._lock:
+            codes = self.location[self._mask(start_dt, end_dt)]
+            names = list(self.location_names)
+        codes = codes[codes >= 0]
+        if len(codes) == 0:
+            return []
+        counts = np.bincount(codes, minlength=len(names))
+        top = np.argsort(counts)[::-1][:n]
+        return [(names[i], int(counts[i])) for i in top if counts[i] > 0]
+
+    def close(self) -> None:
+        self._conn.close()
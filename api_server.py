@@ -0,0 +1,464 @@
+# api_server.py
+"""
+HTTP JSON API cho sự kiện, chạy độc lập với Streamlit (chỉ dùng thư viện chuẩn).
+
+Chạy:
+    python api_server.py --host 127.0.0.1 --port 8000
+    python api_server.py --write-behind   # POST /events đi qua hàng đợi ghi theo nhóm
+
+Các endpoint:
+    GET    /health
+    POST   /parse                {"text": "...", "base_time": "2025-11-27T08:00:00"?}
+    POST   /parse/batch          {"texts": ["...", ...], "base_time": ...?}
+    POST   /events               dict sự kiện như add_event, hoặc {"text": "..."}
+    POST   /events/batch         {"events": [dict sự kiện hoặc {"text": "..."}, ...]}
+        (2 endpoint trên nhận ?on_duplicate=allow|reject|merge; reject + trùng -> 409;
+         "uid" tùy chọn, trùng uid đã có -> 409)
+    POST   /events/batch-delete  {"ids": [1, 2, ...]}
+    GET    /events?start=ISO&end=ISO
+    GET    /events/search?q=...
+    GET    /events/<id>
+    PATCH  /events/<id>          {"title": ..., "location": ..., ...}
+    DELETE /events/<id>
+    GET    /reminders?now=ISO
+    GET    /changes?token=...&limit=500   (đồng bộ tăng dần, xem db.changes_since)
+    POST   /free-slots           {"text": "khi nào tôi rảnh chiều thứ sáu?"}
+                                 hoặc {"start": ISO, "end": ISO, "min_minutes": 30,
+                                       "working_hours": ["08:00", "18:00"]}
+"""
+import argparse
+import json
+import re
+import signal
+import sqlite3
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from datetime import datetime, time, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+from nlp_module import text_to_event, parse_free_time_query
+from db import (
+    init_db,
+    add_event,
+    add_events,
+    DuplicateEventError,
+    DuplicateUidError,
+    DUPLICATE_ALLOW,
+    DUPLICATE_POLICIES,
+    update_event,
+    delete_event,
+    delete_events,
+    get_event,
+    get_events_between,
+    search_events,
+    get_upcoming_events,
+    changes_since,
+    SyncTokenExpiredError,
+    find_free_slots,
+)
+from write_queue import EventWriteQueue
+
+MAX_BODY_BYTES = 10 * 1024 * 1024    # giới hạn kích thước body 1 request
+MAX_UID_LENGTH = 255                 # uid do client gửi (UID trong iCalendar)
+KEEP_ALIVE_TIMEOUT = 15              # giây chờ request tiếp theo trên 1 kết nối keep-alive
+WRITE_QUEUE_TIMEOUT = 30             # giây chờ tối đa hàng đợi ghi (--write-behind) trả id
+
+# hàng đợi ghi theo nhóm, chỉ bật khi chạy với --write-behind
+_write_queue: Optional[EventWriteQueue] = None
+
+
+class ApiError(Exception):
+    """Lỗi trả về cho client với mã HTTP tương ứng."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+# ==========================
+# TIỆN ÍCH
+# ==========================
+
+def _parse_iso(value: Optional[str], name: str) -> datetime:
+    if not value:
+        raise ApiError(400, f"Thiếu tham số '{name}'")
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ApiError(400, f"Tham số '{name}' không phải thời gian ISO: {value}")
+
+
+def _to_event(item) -> Dict:
+    """Nhận dict sự kiện hoặc {"text": ...} (khi đó phân tích bằng text_to_event)."""
+    if not isinstance(item, dict):
+        raise ApiError(400, "Mỗi sự kiện phải là 1 object JSON")
+    if "text" in item:
+        base_time = _parse_iso(item["base_time"], "base_time") if item.get("base_time") else None
+        return text_to_event(item["text"], base_time)
+    if not item.get("event") or not item.get("start_time"):
+        raise ApiError(400, "Sự kiện cần có 'event' và 'start_time'")
+    return _check_fields(item, "event")
+
+
+def _duplicate_policy(query) -> str:
+    policy = query.get("on_duplicate", DUPLICATE_ALLOW)
+    if policy not in DUPLICATE_POLICIES:
+        raise ApiError(400, f"on_duplicate phải là 1 trong {', '.join(DUPLICATE_POLICIES)}")
+    return policy
+
+
+# các trường được phép sửa qua PATCH /events/<id>
+_UPDATE_FIELDS = ("title", "start_time", "end_time", "location", "reminder_minutes", "notified")
+
+
+def _local_iso(value, name: str, nullable: bool = False) -> Optional[str]:
+    """
+    Chuỗi thời gian ISO -> dạng chuẩn lưu trong DB (giờ địa phương, không múi giờ).
+    Có offset (vd. +07:00, Z) thì đổi sang giờ địa phương, vì mọi module khác dùng giờ naive.
+    """
+    if value is None and nullable:
+        return None
+    if not isinstance(value, str):
+        raise ApiError(400, f"'{name}' phải là thời gian ISO")
+    dt = _parse_iso(value.replace("Z", "+00:00") if value.endswith("Z") else value, name)
+    if dt.tzinfo is not None:
+        dt = dt.astimezone().replace(tzinfo=None)
+    return dt.isoformat(timespec="seconds")
+
+
+def _check_fields(item: Dict, title_key: str) -> Dict:
+    """
+    Kiểm tra các trường sự kiện trước khi ghi (dùng cho POST và PATCH), để dữ liệu sai
+    trả về 400 thay vì được lưu nguyên hoặc gây lỗi SQLite. Trả về bản sao đã chuẩn hóa thời gian.
+    """
+    item = dict(item)
+    if title_key in item and (not isinstance(item[title_key], str) or not item[title_key].strip()):
+        raise ApiError(400, f"'{title_key}' phải là chuỗi không rỗng")
+    if "start_time" in item:
+        item["start_time"] = _local_iso(item["start_time"], "start_time")
+    if "end_time" in item:
+        item["end_time"] = _local_iso(item["end_time"], "end_time", nullable=True)
+    if item.get("location") is not None and not isinstance(item["location"], str):
+        raise ApiError(400, "'location' phải là chuỗi hoặc null")
+    for key in ("reminder_minutes", "notified"):
+        if key in item:
+            value = item[key]
+            if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+                raise ApiError(400, f"'{key}' phải là số nguyên không âm")
+    if "notified" in item and item["notified"] not in (0, 1):
+        raise ApiError(400, "'notified' phải là 0 hoặc 1")
+    if item.get("uid") is not None:
+        uid = item["uid"]
+        if (not isinstance(uid, str) or not uid.strip() or len(uid) > MAX_UID_LENGTH
+                or any(ord(ch) < 0x20 or ord(ch) == 0x7f for ch in uid)):
+            raise ApiError(400, f"'uid' phải là chuỗi không rỗng, tối đa {MAX_UID_LENGTH} ký tự, "
+                                "không chứa ký tự điều khiển")
+    return item
+
+
+def _validate_update(body: Dict) -> Dict:
+    """Kiểm tra body của PATCH trước khi ghi."""
+    unknown = set(body) - set(_UPDATE_FIELDS)
+    if unknown:
+        raise ApiError(400, f"Trường không được hỗ trợ: {', '.join(sorted(unknown))}")
+    return _check_fields(body, "title")
+
+
+def _event_id(match) -> int:
+    return int(match.group(1))
+
+
+# ==========================
+# XỬ LÝ TỪNG ENDPOINT
+# ==========================
+
+def handle_health(handler, match, query, body):
+    return 200, {"status": "ok"}
+
+
+def handle_parse(handler, match, query, body):
+    if not isinstance(body, dict) or "text" not in body:
+        raise ApiError(400, "Cần trường 'text'")
+    return 200, _to_event(body)
+
+
+def handle_parse_batch(handler, match, query, body):
+    if not isinstance(body, dict) or not isinstance(body.get("texts"), list):
+        raise ApiError(400, "Cần trường 'texts' là danh sách")
+    base_time = _parse_iso(body["base_time"], "base_time") if body.get("base_time") else None
+    return 200, {"events": [text_to_event(t, base_time) for t in body["texts"]]}
+
+
+def handle_create(handler, match, query, body):
+    event = _to_event(body)
+    policy = _duplicate_policy(query)
+    try:
+        if _write_queue is not None:
+            event_id = _write_queue.submit(event, policy).result(timeout=WRITE_QUEUE_TIMEOUT)
+        else:
+            event_id = add_event(event, policy)
+    except (DuplicateEventError, DuplicateUidError) as e:
+        raise ApiError(409, str(e))
+    except FutureTimeoutError:
+        raise ApiError(503, "Hàng đợi ghi quá tải, thử lại sau")
+    return 201, {"id": event_id, "event": event}
+
+
+def handle_create_batch(handler, match, query, body):
+    if not isinstance(body, dict) or not isinstance(body.get("events"), list):
+        raise ApiError(400, "Cần trường 'events' là danh sách")
+    events = [_to_event(item) for item in body["events"]]
+    try:
+        return 201, {"ids": add_events(events, _duplicate_policy(query))}
+    except (DuplicateEventError, DuplicateUidError) as e:
+        raise ApiError(409, str(e))
+
+
+def handle_delete_batch(handler, match, query, body):
+    if not isinstance(body, dict) or not isinstance(body.get("ids"), list):
+        raise ApiError(400, "Cần trường 'ids' là danh sách")
+    return 200, {"deleted": delete_events([int(i) for i in body["ids"]])}
+
+
+def handle_list(handler, match, query, body):
+    start_dt = _parse_iso(query.get("start"), "start")
+    end_dt = _parse_iso(query.get("end"), "end")
+    return 200, {"events": get_events_between(start_dt, end_dt)}
+
+
+def handle_search(handler, match, query, body):
+    keyword = query.get("q", "").strip()
+    if not keyword:
+        raise ApiError(400, "Thiếu tham số 'q'")
+    return 200, {"events": search_events(keyword)}
+
+
+def handle_get(handler, match, query, body):
+    event = get_event(_event_id(match))
+    if event is None:
+        raise ApiError(404, "Không tìm thấy sự kiện")
+    return 200, event
+
+
+def handle_update(handler, match, query, body):
+    event_id = _event_id(match)
+    if not isinstance(body, dict):
+        raise ApiError(400, "Body phải là 1 object JSON")
+    if get_event(event_id) is None:
+        raise ApiError(404, "Không tìm thấy sự kiện")
+    update_event(event_id, **_validate_update(body))
+    return 200, get_event(event_id)
+
+
+def handle_delete(handler, match, query, body):
+    event_id = _event_id(match)
+    if get_event(event_id) is None:
+        raise ApiError(404, "Không tìm thấy sự kiện")
+    delete_event(event_id)
+    return 200, {"deleted": 1}
+
+
+def handle_reminders(handler, match, query, body):
+    now = _parse_iso(query["now"], "now") if query.get("now") else datetime.now()
+    return 200, {"events": get_upcoming_events(now)}
+
+
+def handle_changes(handler, match, query, body):
+    limit = int(query.get("limit", 500))
+    try:
+        return 200, changes_since(query.get("token"), limit)
+    except SyncTokenExpiredError as e:
+        # 410: client phải đồng bộ lại từ đầu (bỏ token)
+        raise ApiError(410, str(e))
+
+
+def handle_free_slots(handler, match, query, body):
+    if not isinstance(body, dict):
+        raise ApiError(400, "Body phải là 1 object JSON")
+    if "text" in body:
+        base_time = _parse_iso(body["base_time"], "base_time") if body.get("base_time") else None
+        params = parse_free_time_query(body["text"], base_time)
+        if params is None:
+            raise ApiError(400, "Câu không phải câu hỏi giờ rảnh")
+    else:
+        working_hours = body.get("working_hours")
+        if working_hours is not None and (not isinstance(working_hours, list) or len(working_hours) != 2
+                                          or not all(isinstance(h, str) for h in working_hours)):
+            raise ApiError(400, "'working_hours' phải là [\"HH:MM\", \"HH:MM\"]")
+        params = {
+            "range_start": _parse_iso(body.get("start"), "start"),
+            "range_end": _parse_iso(body.get("end"), "end"),
+            "min_duration": timedelta(minutes=int(body.get("min_minutes", 30))),
+            "working_hours": tuple(time.fromisoformat(h) for h in working_hours) if working_hours else None,
+        }
+    slots = find_free_slots(**params)
+    return 200, {"slots": [{"start": s.isoformat(), "end": e.isoformat()} for s, e in slots]}
+
+
+# (method, regex path, hàm xử lý) — thứ tự quan trọng: path cụ thể đứng trước /events/<id>
+ROUTES = [
+    ("GET", r"/health", handle_health),
+    ("POST", r"/parse", handle_parse),
+    ("POST", r"/parse/batch", handle_parse_batch),
+    ("POST", r"/events", handle_create),
+    ("POST", r"/events/batch", handle_create_batch),
+    ("POST", r"/events/batch-delete", handle_delete_batch),
+    ("GET", r"/events", handle_list),
+    ("GET", r"/events/search", handle_search),
+    ("GET", r"/events/(\d+)", handle_get),
+    ("PATCH", r"/events/(\d+)", handle_update),
+    ("DELETE", r"/events/(\d+)", handle_delete),
+    ("GET", r"/reminders", handle_reminders),
+    ("GET", r"/changes", handle_changes),
+    ("POST", r"/free-slots", handle_free_slots),
+]
+_COMPILED_ROUTES = [(method, re.compile(path + r"/?$"), func) for method, path, func in ROUTES]
+
+
+# ==========================
+# HTTP SERVER
+# ==========================
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"      # bật keep-alive
+    timeout = KEEP_ALIVE_TIMEOUT
+    disable_nagle_algorithm = True     # header và body ghi riêng -> tránh trễ do delayed ACK
+
+    def _send_json(self, status: int, payload) -> None:
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        if self.server.shutting_down:
+            # đang tắt server: trả nốt request này rồi đóng kết nối
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_body(self):
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            # không biết body dài bao nhiêu -> không đọc, đóng kết nối
+            self.close_connection = True
+            raise ApiError(400, "Content-Length không hợp lệ")
+        if length > MAX_BODY_BYTES:
+            # body không được đọc -> không thể tái sử dụng kết nối
+            self.close_connection = True
+            raise ApiError(413, "Body quá lớn")
+        if length == 0:
+            return None
+        raw = self.rfile.read(length)
+        try:
+            return json.loads(raw.decode("utf-8"))
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            raise ApiError(400, "Body không phải JSON hợp lệ")
+
+    def _dispatch(self, method: str) -> None:
+        url = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            body = self._read_body()
+            path_matched = False
+            for route_method, pattern, func in _COMPILED_ROUTES:
+                match = pattern.match(url.path)
+                if not match:
+                    continue
+                path_matched = True
+                if route_method == method:
+                    status, payload = func(self, match, query, body)
+                    break
+            else:
+                if path_matched:
+                    raise ApiError(405, "Phương thức không được hỗ trợ")
+                raise ApiError(404, "Không tìm thấy endpoint")
+        except ApiError as e:
+            status, payload = e.status, {"error": e.message}
+        except (ValueError, TypeError) as e:
+            status, payload = 400, {"error": str(e)}
+        except sqlite3.IntegrityError as e:
+            # dữ liệu vi phạm ràng buộc: UNIQUE -> 409, NOT NULL/CHECK... -> 400
+            status = 409 if "UNIQUE" in str(e) else 400
+            payload = {"error": f"Dữ liệu không hợp lệ: {e}"}
+        except Exception as e:
+            self.log_error("Lỗi xử lý %s %s: %r", method, self.path, e)
+            status, payload = 500, {"error": "Lỗi máy chủ"}
+        self._send_json(status, payload)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PATCH(self):
+        self._dispatch("PATCH")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class ApiServer(ThreadingHTTPServer):
+    """Mỗi kết nối 1 thread; khi tắt sẽ chờ các request đang xử lý xong."""
+    daemon_threads = False
+    block_on_close = True
+    request_queue_size = 128           # backlog của socket listen, tránh rớt kết nối khi nhiều client
+
+    def __init__(self, address, quiet: bool = False):
+        super().__init__(address, ApiHandler)
+        self.quiet = quiet
+        self.shutting_down = False
+
+    def graceful_shutdown(self) -> None:
+        """Ngừng nhận request mới; các thread đang chạy được join trong server_close()."""
+        self.shutting_down = True
+        # shutdown() chặn cho tới khi serve_forever() thoát -> gọi từ thread khác
+        threading.Thread(target=self.shutdown, daemon=True).start()
+
+
+def run_server(host: str = "127.0.0.1", port: int = 8000, quiet: bool = False,
+               write_behind: bool = False) -> None:
+    global _write_queue
+    init_db()
+    if write_behind:
+        _write_queue = EventWriteQueue()
+    server = ApiServer((host, port), quiet=quiet)
+
+    def _on_signal(signum, frame):
+        print(f"Nhận tín hiệu {signum}, đang tắt server...")
+        server.graceful_shutdown()
+
+    signal.signal(signal.SIGINT, _on_signal)
+    signal.signal(signal.SIGTERM, _on_signal)
+
+    print(f"API đang chạy tại http://{host}:{port}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if _write_queue is not None:
+            # ghi nốt các sự kiện còn trong hàng đợi
+            _write_queue.close()
+            _write_queue = None
+        print("Đã tắt server.")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="HTTP JSON API cho sự kiện")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8000)
+    ap.add_argument("--quiet", action="store_true", help="không ghi log từng request")
+    ap.add_argument("--write-behind", action="store_true",
+                    help="thêm sự kiện qua hàng đợi ghi theo nhóm (group commit)")
+    args = ap.parse_args()
+    run_server(args.host, args.port, args.quiet, args.write_behind)
@@ -0,0 +1,52 @@
+# calendar_component.py
+import os
+from datetime import datetime
+from typing import Dict, Optional
+
+import streamlit.components.v1 as components
+
+from db import get_day_summaries
+
+_FRONTEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "frontend", "calendar")
+_calendar = components.declare_component("month_calendar", path=_FRONTEND_DIR)
+
+# Số tháng nạp sẵn mỗi phía của tháng đang xem,
+# để chuyển tháng trong khoảng này không cần chạy lại script.
+PRELOAD_MONTHS = 3
+
+
+def _shift_month(year: int, month: int, delta: int) -> tuple[int, int]:
+    index = year * 12 + (month - 1) + delta
+    return index // 12, index % 12 + 1
+
+
+def month_calendar(year: int, month: int, today: Optional[datetime] = None,
+                   key: Optional[str] = None) -> Optional[Dict]:
+    """
+    Vẽ lịch tháng bằng 1 component HTML duy nhất.
+    Dữ liệu gửi xuống chỉ là tóm tắt theo ngày (số sự kiện, giờ + tên sự kiện đầu tiên)
+    cho tháng đang xem và PRELOAD_MONTHS tháng mỗi phía.
+
+    Trả về None hoặc dict do component gửi lên:
+    {"action": "select", "date": "2025-11-27", "year": 2025, "month": 11, "nonce": ...}
+    {"action": "navigate", "year": 2026, "month": 3, "nonce": ...}
+    ("navigate" chỉ gửi khi người dùng đi ra ngoài khoảng tháng đã nạp sẵn.)
+    """
+    if today is None:
+        today = datetime.now()
+
+    first_year, first_month = _shift_month(year, month, -PRELOAD_MONTHS)
+    end_year, end_month = _shift_month(year, month, PRELOAD_MONTHS + 1)
+    summaries = get_day_summaries(datetime(first_year, first_month, 1),
+                                  datetime(end_year, end_month, 1))
+
+    return _calendar(
+        year=year,
+        month=month,
+        today=today.date().isoformat(),
+        range_start=f"{first_year:04d}-{first_month:02d}",
+        range_end=f"{end_year:04d}-{end_month:02d}",
+        summaries=summaries,
+        key=key,
+        default=None,
+    )
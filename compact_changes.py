@@ -0,0 +1,26 @@
+# compact_changes.py
+"""
+Dọn nhật ký thay đổi (bảng event_changes) — chạy định kỳ, ví dụ bằng cron mỗi đêm:
+
+    python compact_changes.py                        # chỉ xóa các dòng đã bị dòng mới hơn thay thế
+    python compact_changes.py --tombstone-days 30    # thêm: xóa tombstone (op = 'delete') cũ hơn 30 ngày
+
+Bước đầu không làm hỏng sync token nào. Với --tombstone-days, client có token cũ hơn
+tombstone bị xóa sẽ nhận lỗi hết hạn (HTTP 410) và phải đồng bộ lại từ đầu.
+Xem db.compact_changes.
+"""
+import argparse
+from datetime import timedelta
+
+from db import init_db, compact_changes
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Dọn nhật ký thay đổi event_changes")
+    ap.add_argument("--tombstone-days", type=float, default=None,
+                    help="xóa tombstone cũ hơn số ngày này (mặc định: giữ lại)")
+    args = ap.parse_args()
+
+    init_db()
+    max_age = timedelta(days=args.tombstone_days) if args.tombstone_days is not None else None
+    removed = compact_changes(max_age)
+    print(f"Đã xóa {removed} dòng khỏi nhật ký thay đổi.")
@@ -1,74 +1,477 @@
 # db.py
+import hashlib
 import json
 import sqlite3
-from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+import unicodedata
+import uuid
+from datetime import datetime, timedelta, time
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 DB_NAME = "events.db"
 
+# Thời lượng mặc định của sự kiện không có end_time (dùng khi tìm giờ rảnh)
+DEFAULT_EVENT_DURATION = timedelta(hours=1)
+# Sự kiện bắt đầu sớm hơn đầu khoảng tìm kiếm tối đa bao lâu vẫn được xét là còn đang diễn ra
+MAX_EVENT_LOOKBACK = timedelta(days=1)
+
+# Chính sách khi thêm sự kiện trùng (cùng tiêu đề, giờ bắt đầu, địa điểm sau chuẩn hóa)
+DUPLICATE_ALLOW = "allow"     # vẫn thêm (hành vi cũ)
+DUPLICATE_REJECT = "reject"   # ném DuplicateEventError
+DUPLICATE_MERGE = "merge"     # gộp vào sự kiện đã có, trả về id cũ
+DUPLICATE_POLICIES = (DUPLICATE_ALLOW, DUPLICATE_REJECT, DUPLICATE_MERGE)
+
 
 def get_connection() -> sqlite3.Connection:
     """Mở kết nối tới database SQLite."""
     return sqlite3.connect(DB_NAME)
 
 
-def init_db() -> None:
-    """Tạo bảng events nếu chưa tồn tại."""
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS events (
+_EVENTS_COLUMNS_SQL = """
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             title TEXT NOT NULL,
             start_time TEXT NOT NULL,  -- ISO string
             end_time TEXT,             -- ISO string hoặc NULL
-            location TEXT,
+            location_id INTEGER REFERENCES locations(id),  -- NULL nếu không có địa điểm
             reminder_minutes INTEGER DEFAULT 10,
-            notified INTEGER DEFAULT 0 -- 0: chưa nhắc, 1: đã nhắc
+            notified INTEGER DEFAULT 0, -- 0: chưa nhắc, 1: đã nhắc
+            uid TEXT,                  -- định danh toàn cục (UID trong iCalendar)
+            fingerprint TEXT           -- hash nội dung, dùng phát hiện sự kiện trùng
+"""
+
+
+def init_db() -> None:
+    """
+    Tạo các bảng events, locations, nhật ký thay đổi (và các index) nếu chưa tồn tại.
+    Database cũ (cột location TEXT trong events) được chuyển sang bảng locations.
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS locations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,  -- không dùng lại id (cache giữ id theo norm)
+            name TEXT NOT NULL,          -- dạng hiển thị (lần đầu gặp)
+            norm TEXT NOT NULL UNIQUE    -- dạng chuẩn hóa, bỏ dấu; UNIQUE index dùng cho tìm theo tiền tố
         );
     """)
+    _migrate_locations_autoincrement(cur)
+    cur.execute(f"CREATE TABLE IF NOT EXISTS events ({_EVENTS_COLUMNS_SQL});")
+    _migrate_location_column(conn, cur)
+    _migrate_uid_column(cur)
+    _migrate_fingerprint_column(conn, cur)
+
+    # index biểu thức (notified, thời điểm nhắc = start_time - reminder_minutes):
+    # get_upcoming_events chỉ quét khoảng index thay vì mọi sự kiện chưa nhắc.
+    # Biểu thức phải giống hệt trong get_upcoming_events thì SQLite mới dùng index.
+    cur.execute("DROP INDEX IF EXISTS idx_events_notified_start")
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_events_notified_remind
+        ON events (notified, datetime(start_time, '-' || COALESCE(reminder_minutes, 0) || ' minutes'));
+    """)
+    # (start_time, end_time): quét theo khoảng thời gian, và tìm giờ rảnh chỉ cần đọc index
+    cur.execute("DROP INDEX IF EXISTS idx_events_start_time")
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_events_start_end
+        ON events (start_time, end_time);
+    """)
+    # "sự kiện tại X": join theo location_id, sắp theo thời gian
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_events_location
+        ON events (location_id, start_time);
+    """)
+    _init_change_log(cur)
     conn.commit()
     conn.close()
 
 
+def _new_uid() -> str:
+    return f"{uuid.uuid4().hex}@doanlichtrinh"
+
+
+def _migrate_uid_column(cur: sqlite3.Cursor) -> None:
+    """Thêm cột uid (nếu thiếu), gán uid cho các sự kiện chưa có, tạo UNIQUE index."""
+    cur.execute("PRAGMA table_info(events)")
+    if "uid" not in [row[1] for row in cur.fetchall()]:
+        cur.execute("ALTER TABLE events ADD COLUMN uid TEXT")
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_events_uid ON events (uid)")
+    # trigger cập nhật chỉ theo dõi các cột nội dung -> gán uid không sinh dòng change log
+    cur.execute("""
+        UPDATE events SET uid = lower(hex(randomblob(16))) || '@doanlichtrinh'
+        WHERE uid IS NULL
+    """)
+
+
+def _migrate_fingerprint_column(conn: sqlite3.Connection, cur: sqlite3.Cursor) -> None:
+    """Thêm cột fingerprint (nếu thiếu) + index, tính fingerprint cho các sự kiện chưa có."""
+    cur.execute("PRAGMA table_info(events)")
+    if "fingerprint" not in [row[1] for row in cur.fetchall()]:
+        cur.execute("ALTER TABLE events ADD COLUMN fingerprint TEXT")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_events_fingerprint ON events (fingerprint)")
+    conn.create_function("event_fingerprint", 3, event_fingerprint, deterministic=True)
+    cur.execute("""
+        UPDATE events
+        SET fingerprint = event_fingerprint(
+            title, start_time, (SELECT norm FROM locations WHERE id = events.location_id))
+        WHERE fingerprint IS NULL
+    """)
+
+
+def _migrate_locations_autoincrement(cur: sqlite3.Cursor) -> None:
+    """Tạo lại bảng locations cũ (id INTEGER PRIMARY KEY) với AUTOINCREMENT, giữ nguyên id."""
+    cur.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'locations'")
+    if "AUTOINCREMENT" in cur.fetchone()[0].upper():
+        return
+    cur.execute("""
+        CREATE TABLE locations_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            norm TEXT NOT NULL UNIQUE
+        );
+    """)
+    cur.execute("INSERT INTO locations_new (id, name, norm) SELECT id, name, norm FROM locations")
+    cur.execute("DROP TABLE locations")
+    cur.execute("ALTER TABLE locations_new RENAME TO locations")
+
+
+def _migrate_location_column(conn: sqlite3.Connection, cur: sqlite3.Cursor) -> None:
+    """
+    Chuyển events.location (TEXT) sang events.location_id -> locations.
+    Bảng events được tạo lại (SQLite không đổi kiểu cột tại chỗ), giữ nguyên id;
+    trigger/index trên events bị xóa theo và được init_db() tạo lại ngay sau đó.
+    """
+    cur.execute("PRAGMA table_info(events)")
+    if "location" not in [row[1] for row in cur.fetchall()]:
+        return
+
+    conn.create_function("normalize_location", 1, normalize_location, deterministic=True)
+    cur.execute("SELECT location FROM events WHERE location IS NOT NULL ORDER BY id")
+    cur.executemany(
+        "INSERT OR IGNORE INTO locations (name, norm) VALUES (?, ?)",
+        [(" ".join(loc.split()), normalize_location(loc))
+         for (loc,) in cur.fetchall() if normalize_location(loc)],
+    )
+    cur.execute("SELECT seq FROM sqlite_sequence WHERE name = 'events'")
+    row = cur.fetchone()
+    old_seq = row[0] if row else 0
+
+    cur.execute(f"CREATE TABLE events_new ({_EVENTS_COLUMNS_SQL});")
+    cur.execute("""
+        INSERT INTO events_new (id, title, start_time, end_time, location_id, reminder_minutes, notified)
+        SELECT e.id, e.title, e.start_time, e.end_time, l.id, e.reminder_minutes, e.notified
+        FROM events e
+        LEFT JOIN locations l ON l.norm = normalize_location(e.location)
+    """)
+    cur.execute("DROP TABLE events")
+    cur.execute("ALTER TABLE events_new RENAME TO events")
+    # giữ bộ đếm AUTOINCREMENT cũ để id đã xóa không bị dùng lại
+    cur.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'events'", (old_seq,))
+
+
+def _init_change_log(cur: sqlite3.Cursor) -> None:
+    """
+    Tạo bảng event_changes (nhật ký thay đổi) + trigger trên events.
+    Lần đầu tạo sẽ ghi 1 dòng 'upsert' cho mỗi sự kiện đang có,
+    để client đồng bộ từ token 0 vẫn nhận đủ dữ liệu.
+    """
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'event_changes'")
+    is_new = cur.fetchone() is None
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS event_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,  -- tăng dần, dùng làm sync token
+            event_id INTEGER NOT NULL,
+            op TEXT NOT NULL,                       -- 'upsert' hoặc 'delete'
+            changed_at TEXT NOT NULL DEFAULT (datetime('now', 'localtime'))
+        );
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_event_changes_event
+        ON event_changes (event_id, seq);
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS sync_state (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+    """)
+
+    if is_new:
+        cur.execute("""
+            INSERT INTO event_changes (event_id, op)
+            SELECT id, 'upsert' FROM events ORDER BY id
+        """)
+
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_events_insert AFTER INSERT ON events
+        BEGIN
+            INSERT INTO event_changes (event_id, op) VALUES (NEW.id, 'upsert');
+        END;
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_events_update
+        AFTER UPDATE OF title, start_time, end_time, location_id, reminder_minutes, notified ON events
+        BEGIN
+            INSERT INTO event_changes (event_id, op) VALUES (NEW.id, 'upsert');
+        END;
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_events_delete AFTER DELETE ON events
+        BEGIN
+            INSERT INTO event_changes (event_id, op) VALUES (OLD.id, 'delete');
+        END;
+    """)
+
+
 # ==========================
-# THÊM / SỬA / XÓA / LẤY 1 SỰ KIỆN
+# ĐỊA ĐIỂM (BẢNG locations)
 # ==========================
 
-def add_event(event: Dict) -> int:
+# cache intern: (DB_NAME, norm) -> locations.id
+_location_cache: Dict[Tuple[str, str], int] = {}
+
+
+def normalize_location(name: Optional[str]) -> str:
     """
-    Thêm 1 sự kiện vào database.
-    event là dict dạng:
-    {
-        "event": "họp nhóm",
-        "start_time": "2025-11-01T10:00:00",
-        "end_time": None,
-        "location": "phòng 302",
-        "reminder_minutes": 15
-    }
-    Trả về id của event vừa thêm.
+    Chuẩn hóa địa điểm để so khớp: chữ thường, bỏ dấu, gộp khoảng trắng.
+    Ví dụ: "  Phòng 302 " -> "phong 302", "An Dương Vương" -> "an duong vuong".
     """
+    if not name:
+        return ""
+    text = name.lower().replace("đ", "d")
+    text = unicodedata.normalize("NFD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(text.split())
+
+
+def _location_id(cur: sqlite3.Cursor, name: Optional[str],
+                 new_locations: Optional[Dict[Tuple[str, str], int]] = None) -> Optional[int]:
+    """
+    Lấy (hoặc tạo) id địa điểm cho name. Trả về None nếu name rỗng.
+    Id đọc trong transaction đang mở (có thể là dòng chưa commit, kể cả dòng do chính
+    transaction này INSERT ở lần gọi trước) không ghi thẳng vào cache mà gom vào
+    new_locations; người gọi đưa vào cache bằng _publish_locations() sau khi commit.
+    """
+    norm = normalize_location(name)
+    if not norm:
+        return None
+    key = (DB_NAME, norm)
+    location_id = _location_cache.get(key)
+    if location_id is not None:
+        return location_id
+
+    cur.execute("INSERT OR IGNORE INTO locations (name, norm) VALUES (?, ?)", (" ".join(name.split()), norm))
+    cur.execute("SELECT id FROM locations WHERE norm = ?", (norm,))
+    location_id = cur.fetchone()[0]
+    if new_locations is not None:
+        new_locations[key] = location_id
+    return location_id
+
+
+def _publish_locations(new_locations: Dict[Tuple[str, str], int]) -> None:
+    """Đưa các id địa điểm đã commit vào cache (gọi sau conn.commit())."""
+    _location_cache.update(new_locations)
+
+
+def clear_location_cache() -> None:
+    """Xóa cache intern địa điểm (khi đổi/xóa file database)."""
+    _location_cache.clear()
+
+
+def suggest_locations(prefix: str, limit: int = 10) -> List[str]:
+    """Gợi ý địa điểm theo tiền tố (không phân biệt dấu/hoa thường), dùng index trên locations.norm."""
+    norm = normalize_location(prefix)
     conn = get_connection()
     cur = conn.cursor()
+    cur.execute("""
+        SELECT name FROM locations
+        WHERE norm >= ? AND norm < ?
+        ORDER BY norm ASC
+        LIMIT ?
+    """, (norm, norm + "\U0010ffff", limit))
+    names = [row[0] for row in cur.fetchall()]
+    conn.close()
+    return names
+
+
+# ==========================
+# THÊM / SỬA / XÓA / LẤY 1 SỰ KIỆN
+# ==========================
+
+# SELECT chung cho các hàm đọc sự kiện; cột location lấy từ bảng locations
+_EVENT_SELECT = """
+        SELECT e.id, e.title, e.start_time, e.end_time, COALESCE(l.name, ''),
+               e.reminder_minutes, e.notified
+        FROM events e
+        LEFT JOIN locations l ON l.id = e.location_id
+"""
+
+
+class DuplicateEventError(ValueError):
+    """Sự kiện trùng với sự kiện đã có (chính sách DUPLICATE_REJECT)."""
+
+    def __init__(self, existing_id: int):
+        super().__init__(f"Sự kiện đã tồn tại (ID = {existing_id})")
+        self.existing_id = existing_id
+
+
+class DuplicateUidError(ValueError):
+    """uid do người gọi truyền vào đã thuộc về 1 sự kiện khác."""
+
+    def __init__(self, uid: str, existing_id: int):
+        super().__init__(f"uid '{uid}' đã được dùng cho sự kiện ID = {existing_id}")
+        self.uid = uid
+        self.existing_id = existing_id
+
+
+def event_fingerprint(title: Optional[str], start_time: Optional[str], location: Optional[str]) -> str:
+    """
+    Hash nội dung của sự kiện: tiêu đề (chữ thường, gộp khoảng trắng),
+    start_time (ISO chuẩn tới giây) và địa điểm đã chuẩn hóa (normalize_location).
+    """
+    title_norm = " ".join(unicodedata.normalize("NFC", title or "").lower().split())
+    start_norm = (start_time or "").strip()
+    try:
+        start_norm = datetime.fromisoformat(start_norm).isoformat(timespec="seconds")
+    except ValueError:
+        pass
+    key = "\x1f".join((title_norm, start_norm, normalize_location(location)))
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _find_duplicate(cur: sqlite3.Cursor, fingerprint: str) -> Optional[int]:
+    cur.execute("SELECT id FROM events WHERE fingerprint = ? ORDER BY id LIMIT 1", (fingerprint,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def _merge_into(cur: sqlite3.Cursor, event_id: int, end_time: Optional[str],
+                reminder_minutes: Optional[int], notified: Optional[int] = None) -> None:
+    """
+    Gộp thông tin của 1 bản trùng vào sự kiện event_id:
+    bổ sung end_time nếu đang trống, giữ mốc nhắc sớm hơn (reminder_minutes lớn hơn),
+    và đánh dấu đã nhắc nếu bản trùng đã được nhắc.
+    Chỉ UPDATE khi thực sự có thay đổi (tránh sinh change log thừa).
+    """
+    cur.execute("""
+        UPDATE events
+        SET end_time = COALESCE(end_time, ?),
+            reminder_minutes = MAX(COALESCE(reminder_minutes, 0), COALESCE(?, 0)),
+            notified = MAX(COALESCE(notified, 0), COALESCE(?, 0))
+        WHERE id = ?
+          AND ((end_time IS NULL AND ? IS NOT NULL)
+               OR COALESCE(reminder_minutes, 0) < COALESCE(?, 0)
+               OR COALESCE(notified, 0) < COALESCE(?, 0))
+    """, (end_time, reminder_minutes, notified, event_id, end_time, reminder_minutes, notified))
+
+
+def _insert_event(cur: sqlite3.Cursor, event: Dict, on_duplicate: str = DUPLICATE_ALLOW,
+                  new_locations: Optional[Dict[Tuple[str, str], int]] = None) -> int:
+    """
+    INSERT 1 sự kiện bằng cursor có sẵn (không commit). Trả về id mới,
+    hoặc id sự kiện đã có nếu trùng và on_duplicate = DUPLICATE_MERGE.
+    new_locations: xem _location_id.
+    """
+    if on_duplicate not in DUPLICATE_POLICIES:
+        raise ValueError(f"on_duplicate không hợp lệ: {on_duplicate!r}")
+    fingerprint = event_fingerprint(event.get("event"), event.get("start_time"), event.get("location"))
+
+    if on_duplicate != DUPLICATE_ALLOW:
+        # tra theo index fingerprint: O(1) mỗi sự kiện
+        existing_id = _find_duplicate(cur, fingerprint)
+        if existing_id is not None:
+            if on_duplicate == DUPLICATE_REJECT:
+                raise DuplicateEventError(existing_id)
+            _merge_into(cur, existing_id, event.get("end_time"), event.get("reminder_minutes", 10))
+            return existing_id
+
+    uid = event.get("uid")
+    if uid:
+        # uid có UNIQUE index: báo lỗi có kiểu thay vì IntegrityError
+        cur.execute("SELECT id FROM events WHERE uid = ?", (uid,))
+        row = cur.fetchone()
+        if row is not None:
+            raise DuplicateUidError(uid, row[0])
+
     cur.execute(
         """
-        INSERT INTO events (title, start_time, end_time, location, reminder_minutes)
-        VALUES (?, ?, ?, ?, ?)
+        INSERT INTO events (title, start_time, end_time, location_id, reminder_minutes, uid, fingerprint)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
         """,
         (
             event.get("event"),
             event.get("start_time"),
             event.get("end_time"),
-            event.get("location"),
+            _location_id(cur, event.get("location"), new_locations),
             event.get("reminder_minutes", 10),
+            uid or _new_uid(),
+            fingerprint,
         ),
     )
-    conn.commit()
-    event_id = cur.lastrowid
-    conn.close()
+    return cur.lastrowid
+
+
+def _begin_for_policy(cur: sqlite3.Cursor, on_duplicate: str) -> None:
+    """
+    Với REJECT/MERGE: mở transaction IMMEDIATE (lấy khóa ghi ngay) để bước tra trùng
+    và INSERT không bị writer khác chen vào giữa. ALLOW giữ transaction mặc định.
+    """
+    if on_duplicate != DUPLICATE_ALLOW:
+        cur.execute("BEGIN IMMEDIATE")
+
+
+def add_event(event: Dict, on_duplicate: str = DUPLICATE_ALLOW) -> int:
+    """
+    Thêm 1 sự kiện vào database.
+    event là dict dạng:
+    {
+        "event": "họp nhóm",
+        "start_time": "2025-11-01T10:00:00",
+        "end_time": None,
+        "location": "phòng 302",
+        "reminder_minutes": 15,
+        "uid": "..."            # tùy chọn, tự sinh nếu không có; trùng -> DuplicateUidError
+    }
+    on_duplicate: xử lý khi đã có sự kiện trùng (cùng tiêu đề, giờ bắt đầu, địa điểm):
+        DUPLICATE_ALLOW  - vẫn thêm
+        DUPLICATE_REJECT - ném DuplicateEventError (có existing_id)
+        DUPLICATE_MERGE  - gộp vào sự kiện cũ, trả về id cũ
+    Trả về id của event vừa thêm.
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    new_locations = {}
+    try:
+        _begin_for_policy(cur, on_duplicate)
+        event_id = _insert_event(cur, event, on_duplicate, new_locations)
+        conn.commit()
+        _publish_locations(new_locations)
+    finally:
+        conn.close()
     return event_id
 
 
+def add_events(events: List[Dict], on_duplicate: str = DUPLICATE_ALLOW) -> List[int]:
+    """
+    Thêm nhiều sự kiện (cùng dạng dict với add_event) trong 1 transaction.
+    Trả về danh sách id theo đúng thứ tự đầu vào.
+    Nếu 1 sự kiện lỗi (kể cả DuplicateEventError) thì không sự kiện nào được thêm.
+    on_duplicate như add_event; sự kiện trùng nhau trong cùng lô cũng được phát hiện.
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    new_locations = {}
+    try:
+        _begin_for_policy(cur, on_duplicate)
+        ids = [_insert_event(cur, event, on_duplicate, new_locations) for event in events]
+        conn.commit()
+        _publish_locations(new_locations)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return ids
+
+
 def update_event(event_id: int, **fields) -> None:
     """
     Cập nhật 1 sự kiện theo id.
@@ -82,41 +485,85 @@ def update_event(event_id: int, **fields) -> None:
     set_clauses = []
     values = []
 
-    for key, value in fields.items():
-        if key in allowed_fields:
-            set_clauses.append(f"{key} = ?")
-            values.append(value)
-
-    if not set_clauses:
+    if not any(key in allowed_fields for key in fields):
         return
 
-    values.append(event_id)
-
     conn = get_connection()
     cur = conn.cursor()
-    sql = f"UPDATE events SET {', '.join(set_clauses)} WHERE id = ?"
-    cur.execute(sql, values)
-    conn.commit()
-    conn.close()
+    new_locations = {}
+    try:
+        for key, value in fields.items():
+            if key == "location":
+                # địa điểm lưu qua bảng locations
+                set_clauses.append("location_id = ?")
+                values.append(_location_id(cur, value, new_locations))
+            elif key in allowed_fields:
+                set_clauses.append(f"{key} = ?")
+                values.append(value)
+
+        values.append(event_id)
+
+        sql = f"UPDATE events SET {', '.join(set_clauses)} WHERE id = ?"
+        cur.execute(sql, values)
+
+        if fields.keys() & {"title", "start_time", "location"}:
+            # nội dung dùng để so trùng thay đổi -> tính lại fingerprint
+            cur.execute("""
+                SELECT e.title, e.start_time, l.norm
+                FROM events e
+                LEFT JOIN locations l ON l.id = e.location_id
+                WHERE e.id = ?
+            """, (event_id,))
+            row = cur.fetchone()
+            if row is not None:
+                cur.execute("UPDATE events SET fingerprint = ? WHERE id = ?",
+                            (event_fingerprint(*row), event_id))
+        conn.commit()
+        _publish_locations(new_locations)
+    except Exception:
+        # không để transaction ghi treo trên kết nối (giữ khóa database)
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
 
 
 def delete_event(event_id: int) -> None:
     """Xóa 1 sự kiện theo id."""
     conn = get_connection()
     cur = conn.cursor()
-    cur.execute("DELETE FROM events WHERE id = ?", (event_id,))
-    conn.commit()
-    conn.close()
+    try:
+        cur.execute("DELETE FROM events WHERE id = ?", (event_id,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def delete_events(event_ids: List[int]) -> int:
+    """Xóa nhiều sự kiện theo id trong 1 transaction. Trả về số sự kiện đã xóa."""
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        cur.executemany("DELETE FROM events WHERE id = ?", [(i,) for i in event_ids])
+        deleted = cur.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return deleted
 
 
 def get_event(event_id: int) -> Optional[Dict]:
     """Lấy thông tin 1 sự kiện theo id. Trả về dict hoặc None."""
     conn = get_connection()
     cur = conn.cursor()
-    cur.execute("""
-        SELECT id, title, start_time, end_time, location, reminder_minutes, notified
-        FROM events
-        WHERE id = ?
+    cur.execute(_EVENT_SELECT + """
+        WHERE e.id = ?
     """, (event_id,))
     row = cur.fetchone()
     conn.close()
@@ -158,11 +605,9 @@ def get_events_between(start_dt: datetime, end_dt: datetime) -> List[Dict]:
     """Lấy các sự kiện có start_time trong [start_dt, end_dt)."""
     conn = get_connection()
     cur = conn.cursor()
-    cur.execute("""
-        SELECT id, title, start_time, end_time, location, reminder_minutes, notified
-        FROM events
-        WHERE start_time >= ? AND start_time < ?
-        ORDER BY start_time ASC
+    cur.execute(_EVENT_SELECT + """
+        WHERE e.start_time >= ? AND e.start_time < ?
+        ORDER BY e.start_time ASC
     """, (start_dt.isoformat(), end_dt.isoformat()))
     rows = cur.fetchall()
     conn.close()
@@ -198,21 +643,180 @@ def get_events_by_month(year: int, month: int) -> List[Dict]:
     return get_events_between(start_dt, next_month)
 
 
+def get_day_summaries(start_dt: datetime, end_dt: datetime) -> Dict[str, Dict]:
+    """
+    Tóm tắt sự kiện theo từng ngày trong [start_dt, end_dt), dùng cho lịch tháng.
+    Trả về dict dạng:
+    {
+        "2025-11-27": {"count": 3, "first_time": "09:30", "first_title": "ăn sáng"},
+        ...
+    }
+    Chỉ đọc 1 dòng gộp cho mỗi ngày thay vì toàn bộ sự kiện.
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    # SQLite: cột "trần" đi kèm MIN() lấy giá trị từ đúng dòng có start_time nhỏ nhất
+    cur.execute("""
+        SELECT substr(start_time, 1, 10) AS day, COUNT(*), MIN(start_time), title
+        FROM events
+        WHERE start_time >= ? AND start_time < ?
+        GROUP BY day
+        ORDER BY day ASC
+    """, (start_dt.isoformat(), end_dt.isoformat()))
+    rows = cur.fetchall()
+    conn.close()
+
+    summaries = {}
+    for day, count, first_start, first_title in rows:
+        summaries[day] = {
+            "count": count,
+            "first_time": first_start[11:16] or "--:--",
+            "first_title": first_title,
+        }
+    return summaries
+
+
 # ==========================
-# TÌM KIẾM THEO TỪ KHÓA
+# TÌM GIỜ RẢNH
 # ==========================
 
-def search_events(keyword: str) -> List[Dict]:
-    """Tìm sự kiện theo từ khóa trong title hoặc location."""
-    kw = f"%{keyword}%"
+def _naive_local(dt: datetime) -> datetime:
+    """datetime có múi giờ -> giờ địa phương không múi giờ (cách lưu trong DB); naive giữ nguyên."""
+    if dt.tzinfo is not None:
+        dt = dt.astimezone().replace(tzinfo=None)
+    return dt
+
+
+def _busy_intervals(rows, default_duration: timedelta):
+    """Gộp các khoảng bận (rows đã sắp theo start_time) thành các khoảng rời nhau, theo thứ tự."""
+    intervals = []
+    needs_sort = False
+    for start_str, end_str in rows:
+        try:
+            start = datetime.fromisoformat(start_str)
+            if start.tzinfo is not None:
+                # dữ liệu cũ có offset: đổi về giờ địa phương, thứ tự chuỗi không còn đúng -> sắp lại
+                start = _naive_local(start)
+                needs_sort = True
+            end = _naive_local(datetime.fromisoformat(end_str)) if end_str else start + default_duration
+        except ValueError:
+            continue
+        if end <= start:
+            end = start + default_duration
+        intervals.append((start, end))
+    if needs_sort:
+        intervals.sort()
+
+    cur_start = cur_end = None
+    for start, end in intervals:
+        if cur_end is None or start > cur_end:
+            if cur_end is not None:
+                yield cur_start, cur_end
+            cur_start, cur_end = start, end
+        elif end > cur_end:
+            cur_end = end
+    if cur_end is not None:
+        yield cur_start, cur_end
+
+
+def _search_windows(range_start: datetime, range_end: datetime,
+                    working_hours: Optional[Tuple[time, time]]):
+    """Các khung giờ được phép xếp lịch trong [range_start, range_end), theo thứ tự."""
+    if working_hours is None:
+        yield range_start, range_end
+        return
+    day = range_start.replace(hour=0, minute=0, second=0, microsecond=0)
+    while day < range_end:
+        start = max(range_start, datetime.combine(day.date(), working_hours[0]))
+        end = min(range_end, datetime.combine(day.date(), working_hours[1]))
+        if start < end:
+            yield start, end
+        day += timedelta(days=1)
+
+
+def find_free_slots(range_start: datetime, range_end: datetime,
+                    min_duration: timedelta = timedelta(minutes=30),
+                    working_hours: Optional[Tuple[time, time]] = None) -> List[Tuple[datetime, datetime]]:
+    """
+    Tìm các khoảng rảnh trong [range_start, range_end).
+    - min_duration: chỉ trả về khoảng rảnh dài ít nhất bằng này.
+    - working_hours: (giờ bắt đầu, giờ kết thúc) mỗi ngày, ví dụ (time(8, 0), time(18, 0));
+      None = cả ngày.
+    Sự kiện không có end_time được coi là kéo dài DEFAULT_EVENT_DURATION.
+    Chỉ quét index (start_time, end_time) theo thứ tự 1 lần rồi gộp tuyến tính.
+    Trả về danh sách (bắt đầu, kết thúc) theo thứ tự thời gian.
+    """
+    if min_duration <= timedelta(0):
+        raise ValueError("min_duration phải lớn hơn 0")
+    range_start, range_end = _naive_local(range_start), _naive_local(range_end)
+    if working_hours is not None and working_hours[0] >= working_hours[1]:
+        raise ValueError("working_hours: giờ bắt đầu phải trước giờ kết thúc")
+    if range_start >= range_end:
+        return []
+
     conn = get_connection()
     cur = conn.cursor()
     cur.execute("""
-        SELECT id, title, start_time, end_time, location, reminder_minutes, notified
+        SELECT start_time, end_time
         FROM events
-        WHERE title LIKE ? OR location LIKE ?
+        WHERE start_time >= ? AND start_time < ?
         ORDER BY start_time ASC
-    """, (kw, kw))
+    """, ((range_start - MAX_EVENT_LOOKBACK).isoformat(), range_end.isoformat()))
+    busy = _busy_intervals(cur, DEFAULT_EVENT_DURATION)
+
+    slots = []
+    busy_start, busy_end = next(busy, (None, None))
+    for win_start, win_end in _search_windows(range_start, range_end, working_hours):
+        free_from = win_start
+        # bỏ qua các khoảng bận đã kết thúc trước khung giờ này
+        while busy_end is not None and busy_end <= free_from:
+            busy_start, busy_end = next(busy, (None, None))
+        while busy_start is not None and busy_start < win_end:
+            if busy_start - free_from >= min_duration:
+                slots.append((free_from, busy_start))
+            free_from = max(free_from, busy_end)
+            if busy_end > win_end:
+                break   # khoảng bận này còn kéo sang khung giờ sau
+            busy_start, busy_end = next(busy, (None, None))
+        if win_end - free_from >= min_duration:
+            slots.append((free_from, win_end))
+    conn.close()
+    return slots
+
+
+# ==========================
+# TÌM KIẾM THEO TỪ KHÓA
+# ==========================
+
+def search_events(keyword: str) -> List[Dict]:
+    """Tìm sự kiện theo từ khóa trong title hoặc location (địa điểm so khớp không dấu)."""
+    kw = f"%{keyword}%"
+    location_kw = f"%{normalize_location(keyword)}%"
+    conn = get_connection()
+    cur = conn.cursor()
+    # LIKE chỉ chạy trên bảng locations (mỗi địa điểm 1 dòng), không phải trên từng event
+    cur.execute(_EVENT_SELECT + """
+        WHERE e.title LIKE ?
+           OR e.location_id IN (SELECT id FROM locations WHERE norm LIKE ?)
+        ORDER BY e.start_time ASC
+    """, (kw, location_kw))
+    rows = cur.fetchall()
+    conn.close()
+    return _rows_to_events(rows)
+
+
+def get_events_at_location(name: str) -> List[Dict]:
+    """Lấy các sự kiện tại 1 địa điểm (so khớp không dấu), sắp theo thời gian."""
+    norm = normalize_location(name)
+    if not norm:
+        return []
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(_EVENT_SELECT + """
+        JOIN locations loc ON loc.id = e.location_id
+        WHERE loc.norm = ?
+        ORDER BY e.start_time ASC
+    """, (norm,))
     rows = cur.fetchall()
     conn.close()
     return _rows_to_events(rows)
@@ -226,10 +830,8 @@ def export_all_events_to_json(filepath: str) -> None:
     conn = get_connection()
     cur = conn.cursor()
 
-    cur.execute("""
-        SELECT id, title, start_time, end_time, location, reminder_minutes, notified
-        FROM events
-        ORDER BY start_time ASC
+    cur.execute(_EVENT_SELECT + """
+        ORDER BY e.start_time ASC
     """)
     rows = cur.fetchall()
     conn.close()
@@ -249,6 +851,222 @@ def export_all_events_to_json(filepath: str) -> None:
     with open(filepath, "w", encoding="utf-8") as f:
         json.dump(events, f, ensure_ascii=False, indent=4)
 
+def iter_all_events(chunk_size: int = 1000) -> Iterator[Dict]:
+    """
+    Duyệt toàn bộ sự kiện theo start_time, đọc từ cursor từng chunk_size dòng
+    (bộ nhớ không phụ thuộc số sự kiện). Mỗi dict có thêm khóa "uid".
+    """
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT e.id, e.title, e.start_time, e.end_time, COALESCE(l.name, ''),
+                   e.reminder_minutes, e.notified, e.uid
+            FROM events e
+            LEFT JOIN locations l ON l.id = e.location_id
+            ORDER BY e.start_time ASC
+        """)
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row, event in zip(rows, _rows_to_events(rows)):
+                event["uid"] = row[7]
+                yield event
+    finally:
+        conn.close()
+
+
+def existing_uids(uids: Iterable[str]) -> Set[str]:
+    """Trả về tập các uid (trong uids) đã có trong database. Tra theo UNIQUE index."""
+    uids = [u for u in uids if u]
+    found = set()
+    conn = get_connection()
+    cur = conn.cursor()
+    # chia nhỏ để không vượt giới hạn số tham số của SQLite
+    for i in range(0, len(uids), 500):
+        part = uids[i:i + 500]
+        cur.execute(
+            f"SELECT uid FROM events WHERE uid IN ({', '.join('?' * len(part))})",
+            part,
+        )
+        found.update(row[0] for row in cur.fetchall())
+    conn.close()
+    return found
+
+
+# ==========================
+# GỘP SỰ KIỆN TRÙNG
+# ==========================
+
+def collapse_duplicate_events(batch_size: int = 500) -> int:
+    """
+    Gộp các sự kiện trùng (cùng fingerprint) đã có trong database: giữ sự kiện có id
+    nhỏ nhất, gộp thông tin các bản còn lại vào nó (như DUPLICATE_MERGE) rồi xóa chúng.
+    Xử lý theo từng lô batch_size nhóm trùng, mỗi lô 1 transaction.
+    Trả về số sự kiện đã xóa.
+    """
+    removed = 0
+    last_fingerprint = ""
+    while True:
+        conn = get_connection()
+        cur = conn.cursor()
+        # duyệt index fingerprint theo thứ tự, tiếp tục từ nhóm cuối của lô trước
+        cur.execute("""
+            SELECT fingerprint FROM events
+            WHERE fingerprint > ?
+            GROUP BY fingerprint
+            HAVING COUNT(*) > 1
+            ORDER BY fingerprint ASC
+            LIMIT ?
+        """, (last_fingerprint, batch_size))
+        fingerprints = [row[0] for row in cur.fetchall()]
+        if not fingerprints:
+            conn.close()
+            break
+
+        cur.execute(f"""
+            SELECT id, fingerprint, end_time, reminder_minutes, notified
+            FROM events
+            WHERE fingerprint IN ({', '.join('?' * len(fingerprints))})
+            ORDER BY fingerprint ASC, id ASC
+        """, fingerprints)
+        keep = {}
+        duplicate_ids = []
+        for event_id, fingerprint, end_time, reminder_minutes, notified in cur.fetchall():
+            if fingerprint not in keep:
+                keep[fingerprint] = event_id
+            else:
+                _merge_into(cur, keep[fingerprint], end_time, reminder_minutes, notified)
+                duplicate_ids.append(event_id)
+        cur.executemany("DELETE FROM events WHERE id = ?", [(i,) for i in duplicate_ids])
+        conn.commit()
+        conn.close()
+
+        removed += len(duplicate_ids)
+        last_fingerprint = fingerprints[-1]
+    return removed
+
+
+# ==========================
+# ĐỒNG BỘ TĂNG DẦN (CHANGE LOG + SYNC TOKEN)
+# ==========================
+
+class SyncTokenExpiredError(ValueError):
+    """Token cũ hơn mốc đã compact: client phải đồng bộ lại từ đầu (token None)."""
+
+
+def _parse_sync_token(token: Optional[str]) -> int:
+    if token is None or token == "":
+        return 0
+    try:
+        seq = int(token)
+    except (TypeError, ValueError):
+        raise ValueError(f"Sync token không hợp lệ: {token!r}")
+    if seq < 0:
+        raise ValueError(f"Sync token không hợp lệ: {token!r}")
+    return seq
+
+
+def changes_since(token: Optional[str], limit: int = 500) -> Dict:
+    """
+    Lấy các thay đổi sau token (None/"" = đồng bộ từ đầu). Trả về dict dạng:
+    {
+        "changes": [
+            {"seq": 42, "op": "upsert", "id": 7, "event": {...}},
+            {"seq": 43, "op": "delete", "id": 5, "event": None},   # tombstone
+        ],
+        "token": "43",      # truyền lại ở lần gọi sau
+        "has_more": False,  # True nếu còn thay đổi, gọi tiếp ngay với token mới
+    }
+    Mỗi sự kiện chỉ xuất hiện 1 lần trong 1 trang, với trạng thái hiện tại của nó.
+    Ném SyncTokenExpiredError nếu token đã bị compact_changes() vượt qua.
+    """
+    since = _parse_sync_token(token)
+    limit = max(1, int(limit))
+
+    conn = get_connection()
+    cur = conn.cursor()
+    if since > 0:
+        cur.execute("SELECT value FROM sync_state WHERE key = 'compacted_through'")
+        row = cur.fetchone()
+        if row is not None and since < row[0]:
+            conn.close()
+            raise SyncTokenExpiredError(f"Sync token {since} đã hết hạn (đã compact tới {row[0]})")
+
+    cur.execute("""
+        SELECT c.seq, c.event_id, c.op,
+               e.id, e.title, e.start_time, e.end_time, COALESCE(l.name, ''),
+               e.reminder_minutes, e.notified
+        FROM event_changes c
+        LEFT JOIN events e ON e.id = c.event_id
+        LEFT JOIN locations l ON l.id = e.location_id
+        WHERE c.seq > ?
+        ORDER BY c.seq ASC
+        LIMIT ?
+    """, (since, limit))
+    rows = cur.fetchall()
+    conn.close()
+
+    # giữ thay đổi cuối cùng của mỗi sự kiện trong trang
+    latest = {}
+    for row in rows:
+        latest[row[1]] = row
+
+    changes = []
+    for row in sorted(latest.values(), key=lambda r: r[0]):
+        seq, event_id, op = row[0], row[1], row[2]
+        if op == "delete" or row[3] is None:
+            changes.append({"seq": seq, "op": "delete", "id": event_id, "event": None})
+        else:
+            changes.append({"seq": seq, "op": "upsert", "id": event_id,
+                            "event": _rows_to_events([row[3:]])[0]})
+
+    new_token = rows[-1][0] if rows else since
+    return {
+        "changes": changes,
+        "token": str(new_token),
+        "has_more": len(rows) == limit,
+    }
+
+
+def compact_changes(tombstone_max_age: Optional[timedelta] = None) -> int:
+    """
+    Dọn nhật ký thay đổi (chạy định kỳ bằng compact_changes.py). Trả về số dòng đã xóa.
+    - Luôn xóa các dòng đã bị dòng mới hơn của cùng sự kiện thay thế
+      (không làm hỏng token nào).
+    - Nếu có tombstone_max_age: xóa các tombstone cũ hơn mốc đó; token cũ hơn
+      tombstone bị xóa sẽ hết hạn (changes_since ném SyncTokenExpiredError).
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("""
+        DELETE FROM event_changes
+        WHERE seq < (SELECT MAX(c2.seq) FROM event_changes c2
+                     WHERE c2.event_id = event_changes.event_id)
+    """)
+    removed = cur.rowcount
+
+    if tombstone_max_age is not None:
+        cutoff = (datetime.now() - tombstone_max_age).isoformat(sep=" ", timespec="seconds")
+        cur.execute("""
+            SELECT MAX(seq) FROM event_changes
+            WHERE op = 'delete' AND changed_at < ?
+        """, (cutoff,))
+        horizon = cur.fetchone()[0]
+        if horizon is not None:
+            cur.execute("DELETE FROM event_changes WHERE op = 'delete' AND seq <= ?", (horizon,))
+            removed += cur.rowcount
+            cur.execute("""
+                INSERT INTO sync_state (key, value) VALUES ('compacted_through', ?)
+                ON CONFLICT(key) DO UPDATE SET value = MAX(value, excluded.value)
+            """, (horizon,))
+
+    conn.commit()
+    conn.close()
+    return removed
+
+
 # ==========================
 # TEST NHANH
 # ==========================
@@ -276,19 +1094,19 @@ if __name__ == "__main__":
     
 def get_upcoming_events(now: datetime):
     """
-    Lấy các sự kiện chưa nhắc, có start_time nằm trong khoảng
-    now -> now + 1 giờ (dự phòng).
+    Lấy các sự kiện chưa nhắc mà thời điểm nhắc (start_time - reminder_minutes)
+    đã tới, tính tại thời điểm now.
     """
     conn = get_connection()
     cur = conn.cursor()
 
-    # Lấy các event chưa nhắc
-    cur.execute("""
-        SELECT id, title, start_time, end_time, location, reminder_minutes, notified
-        FROM events
-        WHERE notified = 0
-        ORDER BY start_time ASC
-    """)
+    # Chỉ lấy các event chưa nhắc đã tới giờ nhắc (start_time - reminder_minutes <= now);
+    # điều kiện trùng biểu thức của idx_events_notified_remind -> tìm theo khoảng index.
+    cur.execute(_EVENT_SELECT + """
+        WHERE e.notified = 0
+          AND datetime(e.start_time, '-' || COALESCE(e.reminder_minutes, 0) || ' minutes') <= datetime(?)
+        ORDER BY e.start_time ASC
+    """, (now.isoformat(timespec="seconds"),))
 
     rows = cur.fetchall()
     conn.close()
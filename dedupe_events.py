@@ -0,0 +1,22 @@
+# dedupe_events.py
+"""
+Gộp các sự kiện trùng đã có trong database (chạy 1 lần, hoặc khi cần dọn dẹp).
+
+    python dedupe_events.py --batch-size 500
+
+Hai sự kiện được coi là trùng khi có cùng tiêu đề, giờ bắt đầu và địa điểm
+(sau khi chuẩn hóa), xem db.event_fingerprint.
+"""
+import argparse
+
+from db import init_db, collapse_duplicate_events
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Gộp các sự kiện trùng trong database")
+    ap.add_argument("--batch-size", type=int, default=500, help="số nhóm trùng mỗi transaction")
+    args = ap.parse_args()
+
+    # init_db tính fingerprint cho các sự kiện cũ chưa có
+    init_db()
+    removed = collapse_duplicate_events(args.batch_size)
+    print(f"Đã gộp và xóa {removed} sự kiện trùng.")
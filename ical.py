@@ -0,0 +1,314 @@
+# ical.py
+"""
+Xuất / nhập sự kiện dạng iCalendar (.ics, RFC 5545) theo kiểu streaming.
+
+- Xuất: đọc từ db.iter_all_events (cursor theo từng chunk), ghi từng VEVENT ra file.
+- Nhập: đọc file từng dòng, gom VEVENT thành lô rồi db.add_events; bỏ qua sự kiện
+  trùng UID với sự kiện đã có.
+Bộ nhớ dùng không phụ thuộc số sự kiện trong lịch.
+
+Ánh xạ:
+    SUMMARY  <-> title         DTSTART <-> start_time     DTEND <-> end_time
+    LOCATION <-> location      UID     <-> uid
+    VALARM (TRIGGER:-PT15M)    <-> reminder_minutes
+Thời gian ghi ra dạng "floating" (giờ địa phương, không múi giờ), giống cách lưu trong DB.
+Không hỗ trợ sự kiện lặp (RRULE): chỉ lấy lần xuất hiện đầu tiên.
+"""
+import re
+from datetime import date, datetime, timezone
+from typing import Dict, Iterable, Iterator, Optional, TextIO
+
+from db import iter_all_events, existing_uids, add_events, DUPLICATE_ALLOW
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:     # Python < 3.9
+    ZoneInfo = None
+
+PRODID = "-//doanlichtrinh//Tro ly lich trinh//VI"
+MAX_LINE_OCTETS = 75
+IMPORT_BATCH_SIZE = 500
+
+_DURATION_RE = re.compile(
+    r"^([+-])?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$"
+)
+
+
+# ==========================
+# ESCAPE / FOLD
+# ==========================
+
+def escape_text(value: str) -> str:
+    """Escape giá trị TEXT theo RFC 5545 (\\\\, ;, , và xuống dòng)."""
+    return (value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\r", "\\n").replace("\n", "\\n"))
+
+
+def _strip_controls(value: str) -> str:
+    """Bỏ ký tự điều khiển (CR, LF, ...) — giá trị như UID không được phép xuống dòng."""
+    return "".join(ch for ch in value if ch >= " " and ch != "\x7f")
+
+
+def unescape_text(value: str) -> str:
+    out = []
+    i = 0
+    while i < len(value):
+        ch = value[i]
+        if ch == "\\" and i + 1 < len(value):
+            nxt = value[i + 1]
+            out.append("\n" if nxt in "nN" else nxt)
+            i += 2
+        else:
+            out.append(ch)
+            i += 1
+    return "".join(out)
+
+
+def fold_line(line: str) -> str:
+    """Gập dòng dài hơn 75 octet (UTF-8) thành nhiều dòng, không cắt giữa 1 ký tự."""
+    if len(line.encode("utf-8")) <= MAX_LINE_OCTETS:
+        return line + "\r\n"
+    parts = []
+    current = ""
+    size = 0
+    limit = MAX_LINE_OCTETS
+    for ch in line:
+        n = len(ch.encode("utf-8"))
+        if size + n > limit:
+            parts.append(current)
+            current, size = "", 0
+            limit = MAX_LINE_OCTETS - 1     # dòng tiếp theo bắt đầu bằng 1 dấu cách
+        current += ch
+        size += n
+    parts.append(current)
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _unfolded_lines(f: TextIO) -> Iterator[str]:
+    """Đọc file .ics, nối các dòng tiếp nối (bắt đầu bằng dấu cách/tab) lại với nhau."""
+    pending = None
+    for raw in f:
+        line = raw.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and pending is not None:
+            pending += line[1:]
+            continue
+        if pending is not None:
+            yield pending
+        pending = line
+    if pending:
+        yield pending
+
+
+# ==========================
+# XUẤT
+# ==========================
+
+def _format_dt(value: str) -> str:
+    dt = datetime.fromisoformat(value)
+    return dt.strftime("%Y%m%dT%H%M%S")
+
+
+def _vevent_lines(event: Dict, dtstamp: str) -> Iterator[str]:
+    yield "BEGIN:VEVENT"
+    # uid có thể do client API gửi: không để CR/LF chèn thêm dòng vào file
+    yield f"UID:{escape_text(_strip_controls(event['uid']))}"
+    yield f"DTSTAMP:{dtstamp}"
+    yield f"DTSTART:{_format_dt(event['start_time'])}"
+    if event.get("end_time"):
+        yield f"DTEND:{_format_dt(event['end_time'])}"
+    yield f"SUMMARY:{escape_text(event['title'] or '')}"
+    if event.get("location"):
+        yield f"LOCATION:{escape_text(event['location'])}"
+    if event.get("reminder_minutes") is not None:
+        yield "BEGIN:VALARM"
+        yield "ACTION:DISPLAY"
+        yield f"DESCRIPTION:{escape_text(event['title'] or '')}"
+        yield f"TRIGGER:-PT{int(event['reminder_minutes'])}M"
+        yield "END:VALARM"
+    yield "END:VEVENT"
+
+
+def write_ics(f: TextIO, events: Iterable[Dict]) -> int:
+    """Ghi các sự kiện (dict có uid) ra file .ics đã mở. Trả về số sự kiện đã ghi."""
+    dtstamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    f.write(fold_line("BEGIN:VCALENDAR"))
+    f.write(fold_line("VERSION:2.0"))
+    f.write(fold_line(f"PRODID:{PRODID}"))
+    f.write(fold_line("CALSCALE:GREGORIAN"))
+    count = 0
+    for event in events:
+        try:
+            lines = list(_vevent_lines(event, dtstamp))
+        except ValueError:
+            continue    # start_time/end_time không hợp lệ
+        for line in lines:
+            f.write(fold_line(line))
+        count += 1
+    f.write(fold_line("END:VCALENDAR"))
+    return count
+
+
+def export_events_to_ics(filepath: str, chunk_size: int = 1000) -> int:
+    """Xuất toàn bộ sự kiện trong database ra file .ics. Trả về số sự kiện."""
+    with open(filepath, "w", encoding="utf-8", newline="") as f:
+        return write_ics(f, iter_all_events(chunk_size))
+
+
+# ==========================
+# NHẬP
+# ==========================
+
+def _split_property(line: str):
+    """'DTSTART;TZID=Asia/Ho_Chi_Minh:20251127T093000' -> ('DTSTART', {'TZID': ...}, '2025...')."""
+    # dấu ':' đầu tiên nằm ngoài ngoặc kép phân tách tên+tham số với giá trị
+    colon = line.find(":")
+    if colon < 0:
+        return None, {}, ""
+    quote = line.find('"', 0, colon)
+    if quote >= 0:
+        # tham số có giá trị trong ngoặc kép (có thể chứa ':') -> dò từng ký tự
+        in_quote = False
+        for i, ch in enumerate(line):
+            if ch == '"':
+                in_quote = not in_quote
+            elif ch == ":" and not in_quote:
+                colon = i
+                break
+        else:
+            return None, {}, ""
+    head, value = line[:colon], line[colon + 1:]
+    if ";" not in head:
+        return head.upper(), {}, value
+    parts = head.split(";")
+    params = {}
+    for p in parts[1:]:
+        if "=" in p:
+            k, v = p.split("=", 1)
+            params[k.upper()] = v.strip('"')
+    return parts[0].upper(), params, value
+
+
+def _basic_datetime(value: str) -> datetime:
+    """'20251127T093000' -> datetime (cắt chuỗi trực tiếp, nhanh hơn strptime)."""
+    if len(value) != 15 or value[8] != "T":
+        raise ValueError(f"Thời gian iCalendar không hợp lệ: {value}")
+    return datetime(int(value[:4]), int(value[4:6]), int(value[6:8]),
+                    int(value[9:11]), int(value[11:13]), int(value[13:15]))
+
+
+def _parse_dt(value: str, params: Dict[str, str]) -> Optional[str]:
+    """Giá trị DATE / DATE-TIME của iCalendar -> chuỗi ISO giờ địa phương (naive)."""
+    value = value.strip()
+    try:
+        if params.get("VALUE") == "DATE" or len(value) == 8:
+            return datetime.combine(date(int(value[:4]), int(value[4:6]), int(value[6:8])),
+                                    datetime.min.time()).isoformat(timespec="seconds")
+        if value.endswith("Z"):
+            dt = _basic_datetime(value[:-1]).replace(tzinfo=timezone.utc)
+            return dt.astimezone().replace(tzinfo=None).isoformat(timespec="seconds")
+        dt = _basic_datetime(value)
+        tzid = params.get("TZID")
+        if tzid and ZoneInfo is not None:
+            try:
+                dt = dt.replace(tzinfo=ZoneInfo(tzid)).astimezone().replace(tzinfo=None)
+            except (KeyError, ValueError):
+                pass    # không biết múi giờ -> coi như giờ địa phương
+        return dt.isoformat(timespec="seconds")
+    except ValueError:
+        return None
+
+
+def _parse_trigger(value: str, params: Dict[str, str]) -> Optional[int]:
+    """TRIGGER dạng khoảng thời gian trước giờ bắt đầu -> số phút nhắc trước."""
+    if params.get("VALUE") == "DATE-TIME" or params.get("RELATED") == "END":
+        return None
+    m = _DURATION_RE.match(value.strip())
+    if not m:
+        return None
+    weeks, days, hours, minutes, seconds = (int(g or 0) for g in m.groups()[1:])
+    total = ((weeks * 7 + days) * 24 + hours) * 60 + minutes + seconds // 60
+    return total if m.group(1) == "-" else 0
+
+
+def iter_ics_events(f: TextIO) -> Iterator[Dict]:
+    """Đọc file .ics đã mở, sinh lần lượt từng sự kiện dạng dict cho db.add_event."""
+    event = None
+    in_alarm = False
+    for line in _unfolded_lines(f):
+        name, params, value = _split_property(line)
+        if name is None:
+            continue
+        upper_value = value.strip().upper()
+        if name == "BEGIN" and upper_value == "VEVENT":
+            event = {"event": None, "start_time": None, "end_time": None,
+                     "location": "", "reminder_minutes": None, "uid": None}
+        elif event is None:
+            continue
+        elif name == "BEGIN" and upper_value == "VALARM":
+            in_alarm = True
+        elif name == "END" and upper_value == "VALARM":
+            in_alarm = False
+        elif name == "END" and upper_value == "VEVENT":
+            if event["start_time"]:
+                if not event["event"]:
+                    event["event"] = "sự kiện"
+                if event["reminder_minutes"] is None:
+                    event["reminder_minutes"] = 10
+                yield event
+            event = None
+        elif in_alarm:
+            if name == "TRIGGER":
+                minutes = _parse_trigger(value, params)
+                # nhiều VALARM: lấy lần nhắc sớm nhất
+                if minutes is not None and (event["reminder_minutes"] is None
+                                            or minutes > event["reminder_minutes"]):
+                    event["reminder_minutes"] = minutes
+        elif name == "UID":
+            event["uid"] = unescape_text(value.strip())
+        elif name == "SUMMARY":
+            event["event"] = unescape_text(value)
+        elif name == "LOCATION":
+            event["location"] = unescape_text(value)
+        elif name == "DTSTART":
+            event["start_time"] = _parse_dt(value, params)
+        elif name == "DTEND":
+            event["end_time"] = _parse_dt(value, params)
+
+
+def import_events_from_ics(filepath_or_file, batch_size: int = IMPORT_BATCH_SIZE,
+                           on_duplicate: str = DUPLICATE_ALLOW) -> Dict[str, int]:
+    """
+    Nhập sự kiện từ file .ics (đường dẫn hoặc file text đã mở) theo từng lô batch_size.
+    Sự kiện có UID đã tồn tại trong database (hoặc lặp lại trong file) bị bỏ qua.
+    on_duplicate: chính sách với sự kiện trùng nội dung (xem db.add_event).
+    Trả về {"imported": số sự kiện đã thêm, "skipped": số sự kiện trùng UID}.
+    """
+    if isinstance(filepath_or_file, str):
+        with open(filepath_or_file, encoding="utf-8", newline="") as f:
+            return import_events_from_ics(f, batch_size, on_duplicate)
+
+    stats = {"imported": 0, "skipped": 0}
+
+    def flush(batch):
+        found = existing_uids(e["uid"] for e in batch)
+        new_events = []
+        seen = set()
+        for e in batch:
+            if e["uid"] and (e["uid"] in found or e["uid"] in seen):
+                stats["skipped"] += 1
+                continue
+            seen.add(e["uid"])
+            new_events.append(e)
+        if new_events:
+            add_events(new_events, on_duplicate)
+            stats["imported"] += len(new_events)
+
+    batch = []
+    for event in iter_ics_events(filepath_or_file):
+        batch.append(event)
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    return stats
@@ -0,0 +1,105 @@
+# load_test.py
+"""
+Đo tải cục bộ cho api_server.py (chỉ dùng thư viện chuẩn).
+
+Ví dụ:
+    python api_server.py --quiet &
+    python load_test.py --concurrency 16 --requests 5000 --path "/events?start=2025-11-01T00:00:00&end=2025-12-01T00:00:00"
+    python load_test.py --method POST --path /parse --body '{"text": "nhắc tôi họp nhóm lúc 10h sáng mai ở phòng 302"}'
+
+Mỗi worker giữ 1 kết nối keep-alive và gửi request tuần tự.
+"""
+import argparse
+import http.client
+import threading
+import time
+from typing import List
+
+
+def _worker(host: str, port: int, method: str, path: str, body: bytes, count: int,
+            latencies: List[float], errors: List[int], lock: threading.Lock) -> None:
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    headers = {"Content-Type": "application/json"} if body else {}
+    local_lat = []
+    local_err = 0
+    for _ in range(count):
+        t0 = time.perf_counter()
+        try:
+            conn.request(method, path, body=body or None, headers=headers)
+            resp = conn.getresponse()
+            resp.read()
+            if resp.status >= 400:
+                local_err += 1
+        except (OSError, http.client.HTTPException):
+            local_err += 1
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+        local_lat.append(time.perf_counter() - t0)
+    conn.close()
+    with lock:
+        latencies.extend(local_lat)
+        errors.append(local_err)
+
+
+def _percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_load_test(host: str, port: int, method: str, path: str, body: str,
+                  concurrency: int, total_requests: int) -> dict:
+    """Chạy đo tải, trả về dict thống kê (requests/giây, độ trễ theo ms)."""
+    per_worker = [total_requests // concurrency] * concurrency
+    for i in range(total_requests % concurrency):
+        per_worker[i] += 1
+
+    latencies: List[float] = []
+    errors: List[int] = []
+    lock = threading.Lock()
+    payload = body.encode("utf-8") if body else b""
+
+    threads = [
+        threading.Thread(target=_worker,
+                         args=(host, port, method, path, payload, n, latencies, errors, lock))
+        for n in per_worker if n > 0
+    ]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": sum(errors),
+        "seconds": elapsed,
+        "rps": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "mean_ms": sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p95_ms": _percentile(latencies, 95) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "max_ms": latencies[-1] * 1000 if latencies else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Đo tải cho api_server.py")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8000)
+    ap.add_argument("--method", default="GET")
+    ap.add_argument("--path", default="/health")
+    ap.add_argument("--body", default="", help="body JSON (cho POST/PATCH)")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--requests", type=int, default=2000)
+    args = ap.parse_args()
+
+    stats = run_load_test(args.host, args.port, args.method.upper(), args.path, args.body,
+                          args.concurrency, args.requests)
+    print(f"{stats['requests']} request, {stats['errors']} lỗi trong {stats['seconds']:.2f}s")
+    print(f"Thông lượng: {stats['rps']:.1f} request/giây")
+    print(f"Độ trễ (ms): trung bình {stats['mean_ms']:.2f} | p50 {stats['p50_ms']:.2f} | "
+          f"p95 {stats['p95_ms']:.2f} | p99 {stats['p99_ms']:.2f} | max {stats['max_ms']:.2f}")
@@ -1,15 +1,18 @@
 import streamlit as st
+import io
 import time
 from datetime import datetime, timedelta, time as time_obj
 from db import export_all_events_to_json
-from streamlit_autorefresh import st_autorefresh
 import calendar
 from collections import defaultdict
 
 
 
 
-from nlp_module import text_to_event
+from nlp_module import text_to_event, is_free_time_query, parse_free_time_query
+from calendar_component import month_calendar
+from analytics import EventSnapshot, WEEKDAY_NAMES
+from ical import export_events_to_ics, import_events_from_ics
 from db import (
     init_db,
     add_event,
@@ -19,7 +22,12 @@ from db import (
     search_events,
     delete_event,
     update_event,
-    get_upcoming_events
+    get_upcoming_events,
+    find_free_slots,
+    suggest_locations,
+    get_events_at_location,
+    DuplicateEventError,
+    DUPLICATE_REJECT
 )
 
 # ============================================================
@@ -44,26 +52,68 @@ def check_reminders():
 # ============================================================
 # 2. KHỞI TẠO DB + UI
 # ============================================================
-init_db()
+REMINDER_POLL_INTERVAL = "10s"   # chu kỳ kiểm tra nhắc nhở (chỉ chạy lại fragment)
+
+
+@st.cache_resource(show_spinner=False)
+def init_db_once():
+    """Chỉ chạy init_db() một lần cho mỗi process Streamlit."""
+    init_db()
+    return True
+
 
 st.set_page_config(page_title="Trợ lý lịch trình", page_icon="📅", layout="wide")
+init_db_once()
 st.title("📅 Trợ lý Quản lý Lịch Trình Cá Nhân")
-# Auto refresh mỗi 30 giây
-st_autorefresh(interval=30000, key="refresh")
 
 
 # 🔔 HIỂN THỊ NHẮC NHỞ
-reminders = check_reminders()
-if reminders:
-    st.header("🔔 NHẮC VIỆC QUAN TRỌNG")
-    for r in reminders:
-        st.warning(
-            f"⏰ Sắp tới giờ: **{r['title']}** lúc *{r['start_time']}* tại **{r['location']}**",
-            icon="⚠️",
-        )
-        update_event(r["id"], notified=1)
-else:
-    st.info("Không có nhắc nhở nào trong thời gian gần.")
+# Fragment tự chạy lại theo chu kỳ, chỉ truy vấn nhắc nhở;
+# phần còn lại của trang chỉ chạy lại khi người dùng thao tác.
+# Nhắc nhở chỉ được đánh dấu notified = 1 trong DB khi người dùng bấm "Đã xem"
+# hoặc khi sự kiện đã bắt đầu, nên tải lại trang / tab khác vẫn thấy nhắc nhở.
+@st.fragment(run_every=REMINDER_POLL_INTERVAL)
+def reminder_banner():
+    now = datetime.now()
+    # lần đầu phiên này thấy từng nhắc nhở
+    first_seen = st.session_state.setdefault("reminder_first_seen", {})
+
+    reminders = []
+    for r in check_reminders():
+        seen_at = first_seen.setdefault(r["id"], now)
+        if seen_at < datetime.fromisoformat(r["start_time"]) <= now:
+            # đã hiện trước giờ bắt đầu và sự kiện nay đã bắt đầu -> thôi nhắc
+            update_event(r["id"], notified=1)
+            first_seen.pop(r["id"], None)
+        else:
+            # (sự kiện đã bắt đầu từ trước khi được hiện: giữ tới khi bấm "Đã xem")
+            reminders.append(r)
+
+    if reminders:
+        st.header("🔔 NHẮC VIỆC QUAN TRỌNG")
+        for r in reminders:
+            col_msg, col_btn = st.columns([8, 1])
+            with col_msg:
+                st.warning(
+                    f"⏰ Sắp tới giờ: **{r['title']}** lúc *{r['start_time']}* tại **{r['location']}**",
+                    icon="⚠️",
+                )
+            with col_btn:
+                if st.button("Đã xem", key=f"dismiss_reminder_{r['id']}"):
+                    update_event(r["id"], notified=1)
+                    first_seen.pop(r["id"], None)
+                    st.rerun(scope="fragment")
+    else:
+        st.info("Không có nhắc nhở nào trong thời gian gần.")
+
+
+reminder_banner()
+
+
+@st.cache_resource(show_spinner=False)
+def get_event_snapshot():
+    """Snapshot dạng cột dùng chung cho mọi phiên, cập nhật tăng dần bằng refresh()."""
+    return EventSnapshot()
 
 
 # ============================================================
@@ -78,10 +128,23 @@ input_text = st.text_input(
 if st.button("Phân tích và thêm sự kiện"):
     if input_text.strip() == "":
         st.warning("Vui lòng nhập câu mô tả sự kiện!")
+    elif is_free_time_query(input_text):
+        # câu hỏi giờ rảnh: trả lời bằng find_free_slots thay vì thêm sự kiện
+        query = parse_free_time_query(input_text)
+        slots = find_free_slots(**query)
+        if slots:
+            st.success(f"Bạn có {len(slots)} khoảng rảnh:")
+            for slot_start, slot_end in slots:
+                st.write(f"🟢 {slot_start.strftime('%d/%m %H:%M')} – {slot_end.strftime('%H:%M')}")
+        else:
+            st.info("Không tìm thấy khoảng rảnh phù hợp.")
     else:
         event = text_to_event(input_text)
-        event_id = add_event(event)
-        st.success(f"Đã thêm sự kiện! (ID = {event_id})")
+        try:
+            event_id = add_event(event, on_duplicate=DUPLICATE_REJECT)
+            st.success(f"Đã thêm sự kiện! (ID = {event_id})")
+        except DuplicateEventError as e:
+            st.warning(f"Sự kiện này đã có trong lịch (ID = {e.existing_id}), không thêm lại.")
         st.json(event)
 
 
@@ -103,10 +166,31 @@ if st.button("📤 Xuất toàn bộ sự kiện ra JSON"):
             mime="application/json"
         )
 
+# Xuất / nhập iCalendar (.ics) để trao đổi với các ứng dụng lịch khác
+ics_col1, ics_col2 = st.columns(2)
+if ics_col1.button("📤 Xuất toàn bộ sự kiện ra iCalendar (.ics)"):
+    filename = f"events_export_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.ics"
+    count = export_events_to_ics(filename)
+    ics_col1.success(f"Đã xuất {count} sự kiện ra file: {filename}")
+    with open(filename, "rb") as f:
+        ics_col1.download_button(
+            label="📥 Tải xuống file .ics",
+            data=f,
+            file_name=filename,
+            mime="text/calendar"
+        )
+
+with ics_col2.form("import_ics_form", clear_on_submit=True):
+    ics_file = st.file_uploader("📥 Nhập sự kiện từ file .ics", type=["ics"])
+    if st.form_submit_button("Nhập") and ics_file is not None:
+        # đọc file tải lên theo kiểu stream, không giải mã toàn bộ 1 lần
+        result = import_events_from_ics(io.TextIOWrapper(ics_file, encoding="utf-8", newline=""))
+        st.success(f"Đã nhập {result['imported']} sự kiện, bỏ qua {result['skipped']} sự kiện trùng.")
+
 
 option = st.selectbox(
     "Chọn chế độ xem:",
-    ["Hôm nay", "Tuần này", "Tháng này", "Lịch tháng", "Tìm kiếm"],
+    ["Hôm nay", "Tuần này", "Tháng này", "Lịch tháng", "Tìm kiếm", "Theo địa điểm", "Thống kê"],
 )
 
 
@@ -130,84 +214,27 @@ elif option == "Tháng này":
 elif option == "Lịch tháng":
     st.subheader("📆 Lịch tháng")
 
-    year = st.number_input("Năm", min_value=2020, max_value=2100, value=now.year)
-    month = st.number_input("Tháng", min_value=1, max_value=12, value=now.month)
-
-    year = int(year)
-    month = int(month)
+    # tháng trung tâm của lịch (chỉ đổi khi người dùng đi ra ngoài khoảng đã nạp sẵn)
+    if "calendar_month" not in st.session_state:
+        st.session_state["calendar_month"] = (now.year, now.month)
+    year, month = st.session_state["calendar_month"]
 
-    # Lấy sự kiện trong tháng
-    events_in_month = get_events_by_month(year, month)
+    picked = month_calendar(year, month, today=now, key="month_calendar")
 
-    from collections import defaultdict
-    import calendar as cal_mod
-    from datetime import date as date_cls
-
-    # Gom sự kiện theo từng ngày
-    events_by_date = defaultdict(list)
-    for e in events_in_month:
-        try:
-            dt = datetime.fromisoformat(e["start_time"])
-            day_key = dt.date()
-            events_by_date[day_key].append(e)
-        except Exception:
-            continue
-
-    cal = cal_mod.Calendar(firstweekday=0)  # 0 = Monday
-    month_days = cal.monthdatescalendar(year, month)
-    today = datetime.now().date()
-
-    # Vẽ từng tuần
-    weekdays = ["T2", "T3", "T4", "T5", "T6", "T7", "CN"]
-    header_cols = st.columns(7)
-    for i, w in enumerate(weekdays):
-        header_cols[i].markdown(f"**{w}**")
-
-    for week in month_days:
-        cols = st.columns(7)
-        for i, day in enumerate(week):
-            with cols[i]:
-                is_current_month = (day.month == month)
-                is_today = (day == today)
-                day_events = events_by_date.get(day, [])
-
-                #header ngày
-                if is_current_month:
-                    if is_today:
-                        st.markdown(f"**{day.day} (hôm nay)**")
-                    else:
-                        st.markdown(f"**{day.day}**")
-                else:
-                    st.markdown(f"<span style='color:#bbbbbb'>{day.day}</span>",
-                                unsafe_allow_html=True)
-
-                #nội dung trong ô
-                if not day_events:
-                    st.write("")  # chừa khoảng trống cho cân
-                elif len(day_events) == 1:
-                    ev = day_events[0]
-                    try:
-                        dt = datetime.fromisoformat(ev["start_time"])
-                        time_str = dt.strftime("%H:%M")
-                    except Exception:
-                        time_str = "--:--"
-                    st.caption(f"{time_str} · {ev['title'][:20]}")
-                    if st.button("🔍 Chi tiết",
-                                 key=f"view_{day.isoformat()}"):
-                        st.session_state["selected_calendar_day"] = day.isoformat()
-                else:
-                    # nhiều hơn 1 sự kiện
-                    st.caption(f"{len(day_events)} sự kiện")
-                    if st.button(f"🔔 Xem {len(day_events)} nhắc",
-                                 key=f"bell_{day.isoformat()}"):
-                        st.session_state["selected_calendar_day"] = day.isoformat()
+    # component giữ giá trị cuối cùng qua các lần rerun -> dùng nonce để chỉ xử lý 1 lần
+    if picked and picked.get("nonce") != st.session_state.get("calendar_nonce"):
+        st.session_state["calendar_nonce"] = picked.get("nonce")
+        if picked.get("action") == "select":
+            st.session_state["selected_calendar_day"] = picked["date"]
+        st.session_state["calendar_month"] = (int(picked["year"]), int(picked["month"]))
+        if picked.get("action") == "navigate":
+            st.rerun()
 
     #Chi tiết ngày được chọn
     sel = st.session_state.get("selected_calendar_day")
     if sel:
-        y, m, d = map(int, sel.split("-"))
-        selected_date = date_cls(y, m, d)
-        day_events = events_by_date.get(selected_date, [])
+        selected_date = datetime.fromisoformat(sel)
+        day_events = get_events_by_day(selected_date)
 
         if day_events:
             st.markdown("---")
@@ -225,32 +252,110 @@ elif option == "Lịch tháng":
     events = []
 
 
-
-
-
-
-
-
 elif option == "Tìm kiếm":
     keyword = st.text_input("Nhập từ khóa:")
     events = search_events(keyword) if keyword.strip() else []
 
+elif option == "Theo địa điểm":
+    prefix = st.text_input("Gõ tên địa điểm (không cần dấu):")
+    # gợi ý theo tiền tố từ bảng locations
+    suggestions = suggest_locations(prefix) if prefix.strip() else []
+    if suggestions:
+        place = st.selectbox("Gợi ý địa điểm:", suggestions)
+        events = get_events_at_location(place)
+        st.subheader(f"📍 Sự kiện tại {place}")
+    elif prefix.strip():
+        st.info("Không có địa điểm phù hợp.")
+
+elif option == "Thống kê":
+    st.subheader("📊 Thống kê sự kiện")
+
+    snapshot = get_event_snapshot()
+    snapshot.refresh()   # chỉ đọc phần thay đổi kể từ lần trước
+    st.metric("Tổng số sự kiện", snapshot.count())
+
+    st.markdown("**Số sự kiện theo thứ và giờ bắt đầu**")
+    heatmap = snapshot.weekday_hour_heatmap()
+    heat_table = {"Thứ": WEEKDAY_NAMES}
+    for hour in range(24):
+        heat_table[f"{hour}h"] = heatmap[:, hour].tolist()
+    st.dataframe(heat_table, hide_index=True, use_container_width=True)
+
+    st.markdown("**Phân bố thời gian nhắc trước (phút)**")
+    bins, counts = snapshot.reminder_lead_time_histogram()
+    labels = [f"{lo}–{hi}" for lo, hi in zip(bins[:-1], bins[1:])] + [f"≥{bins[-1]}"]
+    st.bar_chart({"Khoảng": labels, "Số sự kiện": counts.tolist()}, x="Khoảng", y="Số sự kiện")
+
+    st.markdown("**Địa điểm nhiều sự kiện nhất**")
+    top_locations = snapshot.busiest_locations(10)
+    if top_locations:
+        st.bar_chart(
+            {"Địa điểm": [name for name, _ in top_locations],
+             "Số sự kiện": [n for _, n in top_locations]},
+            x="Địa điểm", y="Số sự kiện"
+        )
+    else:
+        st.info("Chưa có địa điểm nào.")
+
+    show_event_list = False
+    events = []
+
 
 # ============================================================
 # 5. SỬA + XÓA SỰ KIỆN
 # ============================================================
+EVENTS_PAGE_SIZE = 20   # số dòng mỗi trang trong danh sách sự kiện
+
 if show_event_list:
     if events:
-        for e in events:
-            with st.expander(f"ID {e['id']} – {e['title']}", expanded=False):
+        # --- Danh sách rút gọn, chia trang: số phần tử trên trang không phụ thuộc tổng số sự kiện ---
+        total_pages = (len(events) - 1) // EVENTS_PAGE_SIZE + 1
+        page = 1
+        if total_pages > 1:
+            page = st.selectbox(
+                "Trang",
+                list(range(1, total_pages + 1)),
+                key=f"event_page_{option}"
+            )
+        page_events = events[(page - 1) * EVENTS_PAGE_SIZE: page * EVENTS_PAGE_SIZE]
+        st.caption(f"{len(events)} sự kiện · trang {page}/{total_pages}")
+
+        st.dataframe(
+            [
+                {
+                    "ID": e["id"],
+                    "Tiêu đề": e["title"],
+                    "Bắt đầu": e["start_time"],
+                    "Địa điểm": e["location"] or "",
+                    "Nhắc trước (phút)": e["reminder_minutes"],
+                    "Đã nhắc": bool(e["notified"]),
+                }
+                for e in page_events
+            ],
+            hide_index=True,
+            use_container_width=True,
+        )
 
-                # --- Lấy ngày giờ ---
-                try:
-                    start_dt = datetime.fromisoformat(e["start_time"])
-                except:
-                    start_dt = datetime.now()
+        # --- Chỉ tạo form sửa cho đúng 1 sự kiện đang chọn ---
+        events_by_id = {e["id"]: e for e in page_events}
+        editing_id = st.selectbox(
+            "Chọn sự kiện để sửa / xóa",
+            [None] + list(events_by_id),
+            format_func=lambda i: "—" if i is None else f"ID {i} – {events_by_id[i]['title']}",
+            key="editing_event_id"
+        )
 
-                # --- Các trường sửa ---
+        if editing_id is not None:
+            e = events_by_id[editing_id]
+
+            # --- Lấy ngày giờ ---
+            try:
+                start_dt = datetime.fromisoformat(e["start_time"])
+            except:
+                start_dt = datetime.now()
+
+            # form: gõ phím không gây rerun, chỉ gửi khi bấm nút
+            with st.form(key="edit_event_form"):
                 new_title = st.text_input(
                     "Tiêu đề sự kiện",
                     value=e["title"],
@@ -284,31 +389,33 @@ if show_event_list:
                 st.write(f"🔔 Đã nhắc: `{e['notified']}`")
 
                 col1, col2 = st.columns(2)
+                save_clicked = col1.form_submit_button("💾 Lưu thay đổi")
+                delete_clicked = col2.form_submit_button("❌ Xóa sự kiện này")
 
-                # --- Nút LƯU ---
-                if col1.button("💾 Lưu thay đổi", key=f"save_{e['id']}"):
-                    try:
-                        reminder_int = int(new_reminder)
-                        new_start_dt = datetime.combine(new_date, new_time)
-                        update_event(
-                            e["id"],
-                            title=new_title,
-                            start_time=new_start_dt.isoformat(),
-                            location=new_location,
-                            reminder_minutes=reminder_int
-                        )
-                        st.success(f"Đã cập nhật sự kiện ID {e['id']}")
-                        st.rerun()
-
-                    except ValueError:
-                        st.error("Nhắc trước (phút) phải là số nguyên!")
-
-                # --- Nút XÓA ---
-                if col2.button("❌ Xóa sự kiện này", key=f"delete_{e['id']}"):
-                    delete_event(e["id"])
-                    st.success(f"Đã xóa sự kiện ID {e['id']}")
+            # --- Nút LƯU ---
+            if save_clicked:
+                try:
+                    reminder_int = int(new_reminder)
+                    new_start_dt = datetime.combine(new_date, new_time)
+                    update_event(
+                        e["id"],
+                        title=new_title,
+                        start_time=new_start_dt.isoformat(),
+                        location=new_location,
+                        reminder_minutes=reminder_int
+                    )
+                    st.success(f"Đã cập nhật sự kiện ID {e['id']}")
                     st.rerun()
 
+                except ValueError:
+                    st.error("Nhắc trước (phút) phải là số nguyên!")
+
+            # --- Nút XÓA ---
+            if delete_clicked:
+                delete_event(e["id"])
+                st.success(f"Đã xóa sự kiện ID {e['id']}")
+                st.rerun()
+
     else:
         st.info("Không có sự kiện nào.")
 
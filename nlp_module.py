@@ -1,6 +1,6 @@
 # nlp_module.py
 import re
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, time
 from dateutil import parser as dateparser
 from underthesea import word_tokenize
 
@@ -215,6 +215,84 @@ def extract_event_name(text: str) -> str:
     return "sự kiện"
 
 
+# ==========================
+# CÂU HỎI GIỜ RẢNH
+# ==========================
+
+# khung giờ theo buổi khi tìm giờ rảnh
+FREE_TIME_PERIODS = {
+    "sáng": (time(7, 0), time(12, 0)),
+    "trưa": (time(11, 0), time(14, 0)),
+    "chiều": (time(13, 0), time(18, 0)),
+    "tối": (time(18, 0), time(22, 0)),
+}
+FREE_TIME_DEFAULT_HOURS = (time(7, 0), time(22, 0))
+
+
+def is_free_time_query(text: str) -> bool:
+    """Câu hỏi kiểu 'khi nào tôi rảnh chiều thứ sáu?', 'lịch trống tuần sau'."""
+    text = preprocess(text)
+    return bool(re.search(r"rảnh|rãnh|lịch trống|trống lịch", text))
+
+
+def _extract_min_duration(text: str) -> timedelta:
+    """'rảnh 2 tiếng', 'rảnh 45 phút', 'nửa tiếng' -> timedelta (mặc định 30 phút)."""
+    if "nửa tiếng" in text:
+        return timedelta(minutes=30)
+    m = re.search(r"(\d+)\s*(phút|phut|tiếng|tieng)", text)
+    if not m:
+        return timedelta(minutes=30)
+    value = int(m.group(1))
+    if m.group(2).startswith(("tiếng", "tieng")):
+        return timedelta(hours=value)
+    return timedelta(minutes=value)
+
+
+def parse_free_time_query(text: str, base_time: datetime | None = None) -> dict | None:
+    """
+    Phân tích câu hỏi giờ rảnh thành tham số cho db.find_free_slots:
+    {
+        "range_start": datetime,
+        "range_end": datetime,
+        "min_duration": timedelta,
+        "working_hours": (time, time)
+    }
+    Trả về None nếu không phải câu hỏi giờ rảnh.
+    """
+    if not is_free_time_query(text):
+        return None
+    if base_time is None:
+        base_time = datetime.now()
+    text = preprocess(text)
+
+    today = base_time.replace(hour=0, minute=0, second=0, microsecond=0)
+    if "tuần sau" in text or "tuần tới" in text:
+        range_start = today + timedelta(days=7 - today.weekday())
+        range_end = range_start + timedelta(days=7)
+    elif "tuần này" in text:
+        range_start = today
+        range_end = today + timedelta(days=7 - today.weekday())
+    else:
+        day = _parse_relative_day(text, base_time)
+        range_start = day.replace(hour=0, minute=0, second=0, microsecond=0)
+        range_end = range_start + timedelta(days=1)
+    # không gợi ý giờ đã qua
+    range_start = max(range_start, base_time.replace(second=0, microsecond=0))
+
+    working_hours = FREE_TIME_DEFAULT_HOURS
+    for period, hours in FREE_TIME_PERIODS.items():
+        if period in text:
+            working_hours = hours
+            break
+
+    return {
+        "range_start": range_start,
+        "range_end": range_end,
+        "min_duration": _extract_min_duration(text),
+        "working_hours": working_hours,
+    }
+
+
 # ==========================
 # API CHÍNH
 # ==========================
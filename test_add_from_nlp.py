@@ -1,7 +1,7 @@
 # test_add_from_nlp.py
 from datetime import datetime
 from nlp_module import text_to_event
-from db import init_db, add_event, get_events_by_day
+from db import init_db, add_event, get_events_by_day, DUPLICATE_MERGE
 
 if __name__ == "__main__":
     init_db()
@@ -10,7 +10,8 @@ if __name__ == "__main__":
     event = text_to_event(text)
     print("Event sau khi NLP:", event)
 
-    event_id = add_event(event)
+    # chạy lại script không tạo thêm bản trùng
+    event_id = add_event(event, on_duplicate=DUPLICATE_MERGE)
     print("Đã lưu vào DB với id =", event_id)
 
     today = datetime.now()
@@ -0,0 +1,108 @@
+# test_free_slots.py
+"""
+Kiểm tra gộp khoảng bận và tìm giờ rảnh (db.find_free_slots).
+Chạy: python test_free_slots.py   (hoặc pytest test_free_slots.py)
+"""
+import os
+import tempfile
+from datetime import datetime, time, timedelta
+
+import db
+
+
+def _with_events(events, check):
+    """Tạo database tạm với các sự kiện (title, start, end) rồi gọi check()."""
+    old_db_name = db.DB_NAME
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_NAME = os.path.join(tmp, "events.db")
+        db.clear_location_cache()
+        try:
+            db.init_db()
+            db.add_events([{"event": title, "start_time": start, "end_time": end}
+                           for title, start, end in events])
+            check()
+        finally:
+            db.DB_NAME = old_db_name
+            db.clear_location_cache()
+
+
+def dt(hour, minute=0, day=1):
+    return datetime(2030, 1, day, hour, minute)
+
+
+def test_overlapping_and_open_ended_events():
+    def check():
+        slots = db.find_free_slots(dt(8), dt(18), timedelta(minutes=30))
+        # 9:00-11:00 và 10:00-12:00 gộp thành 9:00-12:00;
+        # sự kiện 14:00 không có end_time -> bận tới 15:00 (DEFAULT_EVENT_DURATION)
+        assert slots == [(dt(8), dt(9)), (dt(12), dt(14)), (dt(15), dt(18))]
+
+    _with_events([
+        ("a", "2030-01-01T09:00:00", "2030-01-01T11:00:00"),
+        ("b", "2030-01-01T10:00:00", "2030-01-01T12:00:00"),
+        ("c", "2030-01-01T14:00:00", None),
+    ], check)
+
+
+def test_min_duration_filters_short_gaps():
+    def check():
+        slots = db.find_free_slots(dt(8), dt(12), timedelta(minutes=30))
+        # khe 10:00-10:20 ngắn hơn 30 phút -> bỏ
+        assert slots == [(dt(8), dt(9)), (dt(11), dt(12))]
+
+    _with_events([
+        ("a", "2030-01-01T09:00:00", "2030-01-01T10:00:00"),
+        ("b", "2030-01-01T10:20:00", "2030-01-01T11:00:00"),
+    ], check)
+
+
+def test_busy_span_crossing_working_hours():
+    def check():
+        slots = db.find_free_slots(dt(0), dt(0, day=3), timedelta(minutes=30),
+                                   working_hours=(time(8, 0), time(18, 0)))
+        # bận từ 16:00 ngày 1 tới 10:00 ngày 2: cắt cuối khung ngày 1 và đầu khung ngày 2
+        assert slots == [(dt(8), dt(16)), (dt(10, day=2), dt(18, day=2))]
+
+    _with_events([
+        ("qua đêm", "2030-01-01T16:00:00", "2030-01-02T10:00:00"),
+    ], check)
+
+
+def test_lookback_edge():
+    def check():
+        # bắt đầu đúng MAX_EVENT_LOOKBACK trước đầu khoảng -> vẫn được xét, bận tới 10:00
+        slots = db.find_free_slots(dt(8, day=2), dt(12, day=2), timedelta(minutes=30))
+        assert slots == [(dt(10, day=2), dt(12, day=2))]
+        # dời đầu khoảng thêm 1 phút -> sự kiện nằm ngoài lookback, bị bỏ qua (giới hạn đã biết)
+        slots = db.find_free_slots(dt(8, 1, day=2), dt(12, day=2), timedelta(minutes=30))
+        assert slots == [(dt(8, 1, day=2), dt(12, day=2))]
+
+    _with_events([
+        ("dài", "2030-01-01T08:00:00", "2030-01-02T10:00:00"),
+    ], check)
+
+
+def test_offset_aware_start_time_and_invalid_min_duration():
+    def check():
+        slots = db.find_free_slots(dt(8), dt(18), timedelta(minutes=30))
+        assert all(start < end for start, end in slots)
+        try:
+            db.find_free_slots(dt(8), dt(18), timedelta(0))
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("min_duration = 0 phải bị từ chối")
+
+    _with_events([
+        ("có offset", "2030-01-01T09:00:00+07:00", None),
+        ("thường", "2030-01-01T10:00:00", "2030-01-01T11:00:00"),
+    ], check)
+
+
+if __name__ == "__main__":
+    test_overlapping_and_open_ended_events()
+    test_min_duration_filters_short_gaps()
+    test_busy_span_crossing_working_hours()
+    test_lookback_edge()
+    test_offset_aware_start_time_and_invalid_min_duration()
+    print("OK")
@@ -0,0 +1,46 @@
+# test_location_cache.py
+"""
+Kiểm tra cache địa điểm không giữ id của dòng locations đã bị rollback.
+Chạy: python test_location_cache.py   (hoặc pytest test_location_cache.py)
+"""
+import os
+import sqlite3
+import tempfile
+
+import db
+
+
+def test_rollback_does_not_cache_location():
+    old_db_name = db.DB_NAME
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_NAME = os.path.join(tmp, "events.db")
+        db.clear_location_cache()
+        try:
+            db.init_db()
+            start = "2030-01-01T10:00:00"
+            # địa điểm mới xuất hiện 2 lần trong 1 lô, rồi lô lỗi (title NULL) -> rollback
+            try:
+                db.add_events([
+                    {"event": "a", "start_time": start, "location": "Phòng 999"},
+                    {"event": "b", "start_time": start, "location": "phong 999"},
+                    {"event": None, "start_time": start},
+                ])
+            except sqlite3.IntegrityError:
+                pass
+            else:
+                raise AssertionError("add_events phải lỗi vì title NULL")
+
+            c_id = db.add_event({"event": "c", "start_time": start, "location": "phòng 999"})
+            assert db.get_event(c_id)["location"] == "phòng 999"
+
+            # id của dòng đã rollback không được dùng lại cho địa điểm khác
+            db.add_event({"event": "d", "start_time": start, "location": "Hội trường A"})
+            assert db.get_event(c_id)["location"] == "phòng 999"
+        finally:
+            db.DB_NAME = old_db_name
+            db.clear_location_cache()
+
+
+if __name__ == "__main__":
+    test_rollback_does_not_cache_location()
+    print("OK")
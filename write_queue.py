@@ -0,0 +1,157 @@
+# write_queue.py
+"""
+Hàng đợi ghi sau (write-behind) cho việc thêm sự kiện với tần suất cao.
+
+Thay vì mỗi add_event() tự mở kết nối + commit (mỗi lần 1 fsync, các luồng ghi
+phải xếp hàng chờ khóa SQLite), người gọi submit() sự kiện và nhận Future chứa id.
+1 thread ghi duy nhất gom các sự kiện thành nhóm (tối đa max_batch dòng hoặc
+chờ tối đa max_latency giây) rồi commit 1 lần cho cả nhóm.
+
+Ví dụ:
+    queue = EventWriteQueue()
+    future = queue.submit({"event": "họp nhóm", "start_time": "2025-11-27T10:00:00"})
+    event_id = future.result()
+    queue.close()   # ghi nốt phần còn lại (cũng tự chạy khi thoát chương trình)
+"""
+import atexit
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from typing import Dict
+
+import db
+
+_STOP = object()
+
+
+class EventWriteQueue:
+    """Gom các lệnh thêm sự kiện và commit theo nhóm trên 1 thread ghi riêng."""
+
+    def __init__(self, max_batch: int = 500, max_latency: float = 0.005):
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self._queue: "queue.Queue" = queue.Queue()
+        self._closed = False
+        self._close_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="event-write-queue", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, event: Dict, on_duplicate: str = db.DUPLICATE_ALLOW) -> Future:
+        """
+        Đưa 1 sự kiện (cùng dạng dict với db.add_event) vào hàng đợi. Future trả về id.
+        on_duplicate như db.add_event; với DUPLICATE_REJECT, future nhận DuplicateEventError.
+        """
+        future = Future()
+        with self._close_lock:
+            if self._closed:
+                raise RuntimeError("EventWriteQueue đã đóng")
+            self._queue.put((event, on_duplicate, future))
+        return future
+
+    def flush(self) -> None:
+        """Chờ tới khi mọi sự kiện đã submit đều được ghi xong."""
+        self._queue.join()
+
+    def close(self) -> None:
+        """Ghi nốt các sự kiện còn trong hàng đợi rồi dừng thread ghi."""
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+        atexit.unregister(self.close)
+
+    # ==========================
+    # THREAD GHI
+    # ==========================
+
+    def _collect_batch(self, first) -> tuple[list, bool]:
+        """Gom thêm việc vào nhóm cho tới khi đủ max_batch hoặc hết max_latency."""
+        batch = [first]
+        deadline = time.monotonic() + self.max_latency
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.task_done()
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _write_batch(self, conn, batch: list) -> None:
+        """
+        Ghi cả nhóm trong 1 transaction, mỗi sự kiện trong 1 SAVEPOINT riêng:
+        sự kiện lỗi (vd. DuplicateEventError) chỉ rollback phần của nó và chỉ future
+        của nó nhận exception; phần còn lại vẫn commit 1 lần cho cả nhóm.
+        """
+        # future đã bị hủy thì bỏ qua; từ đây future không thể bị hủy nữa
+        batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        cur = conn.cursor()
+        results = []
+        new_locations = {}
+        try:
+            # có sự kiện cần tra trùng -> khóa ghi ngay từ đầu (xem db._begin_for_policy)
+            if any(on_duplicate != db.DUPLICATE_ALLOW for _, on_duplicate, _ in batch):
+                cur.execute("BEGIN IMMEDIATE")
+            else:
+                cur.execute("BEGIN")
+            for event, on_duplicate, future in batch:
+                row_locations = {}
+                cur.execute("SAVEPOINT write_row")
+                try:
+                    event_id = db._insert_event(cur, event, on_duplicate, row_locations)
+                except Exception as e:
+                    cur.execute("ROLLBACK TO write_row")
+                    cur.execute("RELEASE write_row")
+                    results.append((future, None, e))
+                else:
+                    cur.execute("RELEASE write_row")
+                    new_locations.update(row_locations)
+                    results.append((future, event_id, None))
+            conn.commit()
+        except Exception as e:
+            # lỗi ở mức transaction (khóa DB, lỗi đĩa...): cả nhóm thất bại
+            conn.rollback()
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        db._publish_locations(new_locations)
+        for future, event_id, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(event_id)
+
+    def _run(self) -> None:
+        conn = db.get_connection()
+        try:
+            stopping = False
+            while not stopping:
+                first = self._queue.get()
+                if first is _STOP:
+                    self._queue.task_done()
+                    break
+                batch, stopping = self._collect_batch(first)
+                try:
+                    self._write_batch(conn, batch)
+                except Exception as e:
+                    # không để thread ghi chết: người gọi đang chờ future.result()
+                    for _, _, future in batch:
+                        if not future.done():
+                            try:
+                                future.set_exception(e)
+                            except InvalidStateError:
+                                pass
+                finally:
+                    for _ in batch:
+                        self._queue.task_done()
+        finally:
+            conn.close()